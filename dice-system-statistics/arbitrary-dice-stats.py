@@ -2,6 +2,7 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
+from dice_stats import SuccessTable
 
 
 # success ranges should follow this format
@@ -10,20 +11,21 @@ import matplotlib.pyplot as plt
 # DC + last range <= roll + mod
 # this may mean adjusting the range values to account for "and equal" bounds
 # PF2e example they have +/-10 on DC, you'd put [-9,0,10]
+#
+# the roll is a dice expression, see dice_expression.py for the full syntax
+# e.g. 2d20kh1 for advantage, 4d6dl1 for stats, 1d6! for an exploding die
 
-num_dice = 1
-num_sides = 20
+dice = '1d20'
 success_ranges = np.array([-9,0,10]) #PF2e success ranges
 #success_ranges = np.array([-4,0,5]) #PF2e success ranges
 success_multiplier = np.array([0,0.5,1.0,2])
 
-#num_dice = 2
-#num_sides = 6
+#dice = '2d6'
 #success_ranges = np.array([7,10]) #PBTA success ranges
 #success_multiplier = np.array([0,0,1])
 #
-#num_dice = 2
-#num_sides = 10
+#dice = '2d10'
+#dice = '2d10+2' #Draw Steel with an edge
 #success_ranges = np.array([12,17]) #Draw Steel success ranges
 #success_multiplier = np.array([1,1.5,2])
 #success_multiplier = np.array([1,0,0])
@@ -32,56 +34,15 @@ num_suc_ranges = np.size(success_ranges)+1
 
 
 crits_flag = True
-cf_nums = num_dice
-cs_nums = num_dice*num_sides
 
 hit_arr = np.arange(0,10)
 dc_arr = np.arange(10,20)
 #hit_arr = np.arange(-2,5)
 #dc_arr = np.arange(0,1)
 
-if(num_dice==1):
-  roll_arr = np.arange(1,num_sides+1)
-else:
-  roll_arr = np.zeros((num_dice,num_sides))
-  for i, val in enumerate(roll_arr):
-    roll_arr[i,:] = np.arange(1,num_sides+1)
-  tmp_arr = roll_arr[0,:]
-  for i in range(num_dice-1):
-    tmp_arr = np.add.outer(tmp_arr,roll_arr[i+1,:])
-  roll_arr = np.sort(np.matrix.flatten(tmp_arr))
-
-ratio_mat = np.zeros((np.size(dc_arr), np.size(hit_arr)))
-
-# this double for-loop could probably be written using matrix manipulation
-for i, DC in enumerate(dc_arr):
-  for j, H in enumerate(hit_arr):
-    # check if rolls + hit are in which degree of success
-    dosidx = np.zeros((num_suc_ranges,np.size(roll_arr)), dtype = 'int')
-    idx = np.where(roll_arr+H<DC+success_ranges[0])[0]
-    dosidx[0,idx] = 1
-    for k in range(num_suc_ranges-2):
-      idx = np.where(np.logical_and( DC + success_ranges[k] <= roll_arr + H, roll_arr+H < DC + success_ranges[k+1]))[0]
-      dosidx[k+1,idx] = 1
-    idx = np.where(roll_arr+H>=DC+success_ranges[-1])[0]
-    dosidx[-1,idx] = 1
-
-    # I learned numpy roll for this! funny name (good name, too) for shift-wrapping an array in +/-n indices
-    if(crits_flag):
-      if(dosidx[0,0]==0):
-        dosidx[:,0] = np.roll(dosidx[:,0],-1)
-      if(dosidx[-1,-1]==0):
-        dosidx[:,-1] = np.roll(dosidx[:,-1],1)
-
-    # Now while we don't really need to know which ones are cf and f for calculating the damage in PF2e, it's still nice to have in general
-    # damage_total = (a*num_cf + b* num_f + c*num_s + d*num_cs) / num_sides
-    # a = 0, b = 0, c = damage_hit, d = 2*c
-    # we don't need to know damage_total but the ratio damage_total / damage_hit is the general metric we want
-    tmp = 0
-    for k in range(num_suc_ranges):
-      tmp += success_multiplier[k] * np.count_nonzero(dosidx[k,:])
-
-    ratio_mat[i,j] = tmp / (num_sides** num_dice)
+# success only depends on DC - modifier so one table answers the whole grid
+table = SuccessTable.from_expression(dice, success_ranges, crits_flag)
+ratio_mat = table.ratio(dc_arr[:,None], hit_arr[None,:], success_multiplier)
 
 plt.figure()
 for i, DC in enumerate(dc_arr):
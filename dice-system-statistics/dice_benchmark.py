@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from dice_stats import degree_of_success_ratio, SuccessTable
+from dice_distribution import dice_pmf
+from dice_expression import dice_expression_pmf
+from dice_simulation import simulate_check
+from dice_damage import turn_damage
+from dice_cache import clear_dice_cache
+
+
+# benchmarks for the dice statistics engines, e.g.
+#   ./dice_benchmark.py --save baseline.json          record a baseline
+#   ./dice_benchmark.py --compare baseline.json       exit 1 on a regression
+#   ./dice_benchmark.py -k loop -k table              only names containing loop or table
+# wall time is the best of --repeat runs, peak memory is what tracemalloc sees
+# (numpy reports its array allocations to it) over one extra run
+
+def loop_ratio(roll_arr, success_ranges, success_multiplier, dc_arr, hit_arr, crits_flag=True):
+  """
+  The original double for-loop from arbitrary-dice-stats.py, kept as the reference
+  the faster engines are measured against.
+  """
+  num_suc_ranges = np.size(success_ranges)+1
+  ratio_mat = np.zeros((np.size(dc_arr), np.size(hit_arr)))
+
+  for i, DC in enumerate(dc_arr):
+    for j, H in enumerate(hit_arr):
+      # check if rolls + hit are in which degree of success
+      dosidx = np.zeros((num_suc_ranges,np.size(roll_arr)), dtype = 'int')
+      idx = np.where(roll_arr+H<DC+success_ranges[0])[0]
+      dosidx[0,idx] = 1
+      for k in range(num_suc_ranges-2):
+        idx = np.where(np.logical_and( DC + success_ranges[k] <= roll_arr + H, roll_arr+H < DC + success_ranges[k+1]))[0]
+        dosidx[k+1,idx] = 1
+      idx = np.where(roll_arr+H>=DC+success_ranges[-1])[0]
+      dosidx[-1,idx] = 1
+
+      if(crits_flag):
+        if(dosidx[0,0]==0):
+          dosidx[:,0] = np.roll(dosidx[:,0],-1)
+        if(dosidx[-1,-1]==0):
+          dosidx[:,-1] = np.roll(dosidx[:,-1],1)
+
+      tmp = 0
+      for k in range(num_suc_ranges):
+        tmp += success_multiplier[k] * np.count_nonzero(dosidx[k,:])
+
+      ratio_mat[i,j] = tmp / np.size(roll_arr)
+
+  return ratio_mat
+
+def enumerate_rolls(num_dice, num_sides):
+  # the np.add.outer enumeration arbitrary-dice-stats.py used before dice_distribution
+  tmp_arr = np.arange(1,num_sides+1)
+  for i in range(num_dice-1):
+    tmp_arr = np.add.outer(tmp_arr, np.arange(1,num_sides+1))
+  return np.sort(tmp_arr.flatten())
+
+pf2e_ranges = np.array([-9,0,10])
+pf2e_multiplier = np.array([0,0.5,1.0,2])
+draw_steel_ranges = np.array([12,17])
+draw_steel_multiplier = np.array([1,1.5,2])
+
+def grid(num_dc, num_hit):
+  return np.arange(10,10+num_dc), np.arange(0,num_hit)
+
+def vectorized_ratio(pmf, success_ranges, success_multiplier, dc_arr, hit_arr):
+  totals, weights = pmf
+  return degree_of_success_ratio(totals, success_ranges, success_multiplier, dc_arr, hit_arr, weights=weights)
+
+def table_ratio(expression, success_ranges, success_multiplier, dc_arr, hit_arr):
+  totals, weights = dice_expression_pmf(expression)
+  table = SuccessTable(totals, weights, success_ranges)
+  return table.ratio(dc_arr[:,None], hit_arr[None,:], success_multiplier)
+
+def from_scratch(fn):
+  """
+  Wrap a workload that goes through dice_cache so every run starts with the
+  memory cache empty and the disk cache off, and builds its distributions.
+  """
+  def run():
+    clear_dice_cache()
+    cache_dir = os.environ.pop('DICE_CACHE_DIR', None)
+    try:
+      return fn()
+    finally:
+      if cache_dir is not None:
+        os.environ['DICE_CACHE_DIR'] = cache_dir
+  return run
+
+# name -> function, every one runs a whole workload from scratch, distributions included
+benchmarks = {
+  'loop 1d20 10x10': lambda: loop_ratio(np.arange(1,21), pf2e_ranges, pf2e_multiplier, *grid(10,10)),
+  'vectorized 1d20 10x10': lambda: vectorized_ratio(dice_pmf(1,20), pf2e_ranges, pf2e_multiplier, *grid(10,10)),
+  'table 1d20 10x10': lambda: table_ratio('1d20', pf2e_ranges, pf2e_multiplier, *grid(10,10)),
+  'loop 2d10 draw steel 10x10': lambda: loop_ratio(enumerate_rolls(2,10), draw_steel_ranges, draw_steel_multiplier, *grid(10,10)),
+  'vectorized 2d10 draw steel 10x10': lambda: vectorized_ratio(dice_pmf(2,10), draw_steel_ranges, draw_steel_multiplier, *grid(10,10)),
+  'table 2d10 draw steel 10x10': lambda: table_ratio('2d10', draw_steel_ranges, draw_steel_multiplier, *grid(10,10)),
+  'loop 4d6 100x100': lambda: loop_ratio(enumerate_rolls(4,6), pf2e_ranges, pf2e_multiplier, *grid(100,100)),
+  'vectorized 4d6 100x100': lambda: vectorized_ratio(dice_pmf(4,6), pf2e_ranges, pf2e_multiplier, *grid(100,100)),
+  'table 4d6 100x100': lambda: table_ratio('4d6', pf2e_ranges, pf2e_multiplier, *grid(100,100)),
+  'pmf 20d6': lambda: dice_pmf(20,6),
+  'pmf 30d20 fft': lambda: dice_pmf(30,20),
+  'table 20d6 1000x1000': lambda: table_ratio('20d6', pf2e_ranges, pf2e_multiplier, *grid(1000,1000)),
+  'expression 4d6dl1+2d20kh1+1d6!': lambda: dice_expression_pmf('4d6dl1+2d20kh1+1d6!'),
+  'simulate 1d20 1e6 trials': from_scratch(lambda: simulate_check('1d20', 20, 8, pf2e_ranges, pf2e_multiplier,
+                                                                  trials=10**6, seed=0)),
+  'turn damage 50x200': from_scratch(lambda: turn_damage('1d20', np.arange(10,60)[:,None], np.arange(0,200)[None,:]%40,
+                                                         '2d8+4')),
+}
+
+# time regressions smaller than this many seconds are ignored
+time_slack = 1e-3
+
+def run_benchmark(fn, repeat):
+  """
+  Best wall time of repeat runs and peak traced memory of one more run.
+  """
+  times = []
+  for i in range(repeat):
+    start = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start)
+
+  tracemalloc.start()
+  fn()
+  current, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  return {'time': min(times), 'peak_bytes': peak}
+
+def compare(results, baseline, threshold):
+  """
+  One message per benchmark time or peak memory that grew past threshold times the baseline.
+  """
+  regressions = []
+  for name, result in results.items():
+    if name not in baseline:
+      continue
+    for key in ('time', 'peak_bytes'):
+      # sub-millisecond timings are mostly noise, only flag them once the slowdown is real time
+      if key == 'time' and result[key] - baseline[name][key] < time_slack:
+        continue
+      if result[key] > threshold * baseline[name][key]:
+        regressions.append(f'{name}: {key} {result[key]:.4g} vs baseline {baseline[name][key]:.4g}')
+  return regressions
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Benchmark the dice statistics engines.')
+  parser.add_argument('-k', dest='filters', action='append', help='only run benchmarks whose name contains this, repeatable')
+  parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark, the best is kept (default: 5)')
+  parser.add_argument('--save', metavar='PATH', help='write the results as a json baseline')
+  parser.add_argument('--compare', metavar='PATH', help='json baseline to check the results against')
+  parser.add_argument('--threshold', type=float, default=1.5,
+                      help='fail when time or memory exceeds this multiple of the baseline (default: 1.5)')
+  args = parser.parse_args(argv)
+
+  results = {}
+  print(f'{"benchmark":40} {"time (ms)":>12} {"peak (KiB)":>12}')
+  for name, fn in benchmarks.items():
+    if args.filters and not any(f in name for f in args.filters):
+      continue
+    results[name] = run_benchmark(fn, args.repeat)
+    print(f'{name:40} {1e3*results[name]["time"]:12.3f} {results[name]["peak_bytes"]/1024:12.1f}')
+
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(results, f, indent=2)
+
+  if args.compare:
+    with open(args.compare, 'r') as f:
+      baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+      print('\nRegressions:')
+      for regression in regressions:
+        print('  ' + regression)
+      return 1
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+
+import os
+import hashlib
+import tempfile
+import functools
+
+import numpy as np
+
+import dice_expression
+from dice_expression import dice_expression_pmf, normalize_dice_expression
+
+
+# distributions are cached in memory per process and optionally on disk as .npz
+# files so batch runs and worker processes never rebuild the same roll twice
+# set DICE_CACHE_DIR (or pass cache_dir) to turn on the disk cache
+
+# bump when the distribution math or file layout changes to orphan old files
+cache_version = 1
+memory_cache_size = 256
+
+def dice_cache_key(expression, explode_depth=None):
+  """
+  Normalized key for a dice expression, 4d6dl1 and 4d6kh3 share a key.
+  """
+  key = normalize_dice_expression(expression)
+  if '!' in key:
+    # exploding distributions depend on how far they are truncated
+    depth = explode_depth if explode_depth is not None else f'tol{dice_expression.explode_tolerance:g}'
+    key += f'@{depth}'
+  return key
+
+def dice_cache_path(cache_dir, key):
+  """
+  File the disk cache uses for a key, hashed so any expression is a safe file name.
+  """
+  digest = hashlib.sha1(f'{cache_version}|{key}'.encode()).hexdigest()[:20]
+  return os.path.join(cache_dir, f'pmf-{digest}.npz')
+
+def read_cached_pmf(path, key):
+  try:
+    with np.load(path) as cached:
+      if str(cached['key']) != key or int(cached['version']) != cache_version:
+        return None
+      return cached['totals'], cached['weights'], cached['cumulative']
+  except (OSError, KeyError, ValueError):
+    # missing, half written or foreign file, just rebuild it
+    return None
+
+def write_cached_pmf(path, key, totals, weights, cumulative):
+  # write to a temp file and rename so parallel workers never see a partial file
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npz')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      np.savez_compressed(f, key=key, version=cache_version, totals=totals, weights=weights, cumulative=cumulative)
+    os.replace(tmp_path, path)
+  except OSError:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+
+@functools.lru_cache(maxsize=memory_cache_size)
+def load_pmf(key, expression, explode_depth, cache_dir):
+  path = dice_cache_path(cache_dir, key) if cache_dir else None
+
+  cached = read_cached_pmf(path, key) if path and os.path.exists(path) else None
+  if cached is None:
+    totals, weights = dice_expression_pmf(expression, explode_depth)
+    cumulative = np.cumsum(weights)
+    if path:
+      write_cached_pmf(path, key, totals, weights, cumulative)
+  else:
+    totals, weights, cumulative = cached
+
+  # every caller shares these arrays so make sure nobody edits them in place
+  for arr in (totals, weights, cumulative):
+    arr.setflags(write=False)
+  return totals, weights, cumulative
+
+def cached_dice_pmf(expression, explode_depth=None, cache_dir=None):
+  """
+  Cached version of dice_expression.dice_expression_pmf.
+
+  Parameters:
+  - expression: dice expression, e.g. '2d20kh1'
+  - explode_depth: passed through to dice_expression_pmf
+  - cache_dir: directory for the .npz disk cache, defaults to $DICE_CACHE_DIR,
+    the disk cache is skipped when neither is set
+
+  Returns read-only (totals, weights, cumulative) where cumulative is np.cumsum(weights).
+  """
+  if cache_dir is None:
+    cache_dir = os.environ.get('DICE_CACHE_DIR')
+  key = dice_cache_key(expression, explode_depth)
+  return load_pmf(key, normalize_dice_expression(expression), explode_depth, cache_dir)
+
+def clear_dice_cache(cache_dir=None):
+  """
+  Empty the in-memory cache and, if given, delete the .npz files in cache_dir.
+  """
+  load_pmf.cache_clear()
+  if cache_dir and os.path.isdir(cache_dir):
+    for name in os.listdir(cache_dir):
+      if name.startswith('pmf-') and name.endswith('.npz'):
+        os.remove(os.path.join(cache_dir, name))
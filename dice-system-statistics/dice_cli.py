@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+
+import sys
+import argparse
+
+import numpy as np
+
+from dice_stats import SuccessTable, dice_systems
+
+
+# headless version of arbitrary-dice-stats.py, e.g.
+#   ./dice_cli.py --system pf2e --dc 0:61 --mod=-10:51 -o pf2e.csv
+#   ./dice_cli.py --dice 2d20kh1 --ranges=-9,0,10 --multipliers 0,0.5,1,2 -o adv.npz
+# (negative values need the --opt=value form so they aren't read as flags)
+# matplotlib is only imported when --plot or --save-plot is given
+
+def parse_int_range(text):
+  """
+  '10:20' or '10:20:2' like np.arange, '10,12,15' as a list, or a single '15'.
+  """
+  if ':' in text:
+    return np.arange(*[int(v) for v in text.split(':')])
+  return np.array([int(v) for v in text.split(',')])
+
+def parse_float_list(text):
+  return np.array([float(v) for v in text.split(',')])
+
+def grid_columns(dc_arr, hit_arr, ratio_mat, probabilities):
+  """
+  Flatten a (DC, modifier) grid into columns, one row per pair.
+  """
+  dc_grid, hit_grid = np.meshgrid(dc_arr, hit_arr, indexing='ij')
+  columns = {'dc': dc_grid.ravel(), 'modifier': hit_grid.ravel(), 'ratio': ratio_mat.ravel()}
+  for k in range(probabilities.shape[-1]):
+    columns[f'p_degree_{k}'] = probabilities[...,k].ravel()
+  return columns
+
+def output_format(path):
+  if path == '-' or path.endswith('.csv'):
+    return 'csv'
+  for fmt in ('parquet', 'npz', 'npy'):
+    if path.endswith('.' + fmt):
+      return fmt
+  raise ValueError(f'Unknown output format for {path}, use .csv, .parquet, .npz or .npy')
+
+def write_grid(path, dc_arr, hit_arr, ratio_mat, probabilities):
+  """
+  Write results based on the file extension.
+
+  - .csv / '-' (stdout): one row per (DC, modifier) with the ratio and per-degree probabilities
+  - .parquet: the same columns, needs pandas and pyarrow
+  - .npz: dc_arr, hit_arr, ratio_mat and probabilities arrays
+  - .npy: ratio_mat only
+  """
+  fmt = output_format(path)
+  if fmt == 'csv':
+    columns = grid_columns(dc_arr, hit_arr, ratio_mat, probabilities)
+    # %s keeps the shortest round-tripping float repr
+    row_fmt = ['%d', '%d'] + ['%s']*(len(columns)-2)
+    np.savetxt(sys.stdout if path == '-' else path, np.column_stack(list(columns.values())),
+               fmt=row_fmt, delimiter=',', header=','.join(columns), comments='')
+  elif fmt == 'parquet':
+    import pandas as pd
+    pd.DataFrame(grid_columns(dc_arr, hit_arr, ratio_mat, probabilities)).to_parquet(path, index=False)
+  elif fmt == 'npz':
+    np.savez_compressed(path, dc_arr=dc_arr, hit_arr=hit_arr, ratio_mat=ratio_mat, probabilities=probabilities)
+  else:
+    np.save(path, ratio_mat)
+
+def plot_grid(dc_arr, hit_arr, ratio_mat, save_path=None):
+  import matplotlib
+  if save_path:
+    matplotlib.use('Agg')
+  import matplotlib.pyplot as plt
+
+  plt.figure()
+  for i, DC in enumerate(dc_arr):
+    plt.plot(hit_arr, ratio_mat[i,:], 'k:')
+    plt.plot(hit_arr, ratio_mat[i,:], '^', label='DC:%d'%DC)
+
+  plt.xlabel('modifier bonus')
+  plt.ylabel('ratio of degree of success')
+  plt.ylim(0,np.max(ratio_mat))
+  plt.legend(loc='upper left')
+  plt.grid(True)
+  if save_path:
+    plt.savefig(save_path)
+  else:
+    plt.show()
+  plt.close()
+
+def build_parser():
+  parser = argparse.ArgumentParser(description='Degree of success statistics over a DC/modifier grid.')
+  parser.add_argument('--system', choices=sorted(dice_systems), default='pf2e',
+                      help='preset dice, success ranges, multipliers and crit rule (default: pf2e)')
+  parser.add_argument('--dice', help='dice expression, overrides the preset, e.g. 2d20kh1')
+  parser.add_argument('--ranges', type=parse_int_range, help='comma separated success ranges, overrides the preset')
+  parser.add_argument('--multipliers', type=parse_float_list, help='comma separated success multipliers, overrides the preset')
+  crits = parser.add_mutually_exclusive_group()
+  crits.add_argument('--crits', dest='crits_flag', action='store_true', default=None, help='shift natural min/max a degree')
+  crits.add_argument('--no-crits', dest='crits_flag', action='store_false', help='no natural min/max shift')
+  parser.add_argument('--dc', type=parse_int_range, default=np.arange(10,20), help='DCs, e.g. 10:20 (default)')
+  parser.add_argument('--mod', type=parse_int_range, default=np.arange(0,10), help='modifiers, e.g. 0:10 (default)')
+  parser.add_argument('-o', '--output', default='-', help='.csv, .parquet, .npz, .npy or - for csv on stdout (default)')
+  parser.add_argument('--plot', action='store_true', help='show the ratio plot')
+  parser.add_argument('--save-plot', metavar='PATH', help='save the ratio plot instead of showing it')
+  return parser
+
+def main(argv=None):
+  args = build_parser().parse_args(argv)
+
+  system = dice_systems[args.system]
+  dice = args.dice or system['dice']
+  success_ranges = args.ranges if args.ranges is not None else np.array(system['success_ranges'])
+  success_multiplier = args.multipliers if args.multipliers is not None else np.array(system['success_multiplier'])
+  crits_flag = args.crits_flag if args.crits_flag is not None else system['crits_flag']
+
+  if np.size(success_multiplier) != np.size(success_ranges)+1:
+    print(f'Need {np.size(success_ranges)+1} multipliers for {np.size(success_ranges)} success ranges', file=sys.stderr)
+    return 2
+  if np.any(np.diff(success_ranges) < 0):
+    print(f'Success ranges must be in ascending order, got {",".join(map(str, success_ranges.tolist()))}', file=sys.stderr)
+    return 2
+
+  try:
+    # checked before the grid is computed so a typo doesn't cost a whole run
+    output_format(args.output)
+    table = SuccessTable.from_expression(dice, success_ranges, crits_flag)
+  except ValueError as e:
+    print(f'Error: {e}', file=sys.stderr)
+    return 2
+
+  dc_arr = args.dc
+  hit_arr = args.mod
+  ratio_mat = table.ratio(dc_arr[:,None], hit_arr[None,:], success_multiplier)
+  probabilities = table.probabilities(dc_arr[:,None], hit_arr[None,:])
+
+  write_grid(args.output, dc_arr, hit_arr, ratio_mat, probabilities)
+
+  if args.plot or args.save_plot:
+    plot_grid(dc_arr, hit_arr, ratio_mat, args.save_plot)
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
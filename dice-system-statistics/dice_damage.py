@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+import numpy as np
+
+from dice_stats import SuccessTable
+from dice_cache import cached_dice_pmf
+
+
+# full turn damage on top of the degree of success tables, e.g. a PF2e
+# Strike-Strike-Strike with 2d8+4 damage, crits doubled and the -5/-10 MAP
+#
+# damage distributions are dense probability arrays indexed by damage 0..max,
+# with any leading axes being a grid of (AC, attack bonus) pairs, so one call
+# covers a whole bestiary vs party matrix:
+#   expected, pmf = turn_damage('1d20', party_ac[:,None], monster_bonus[None,:], '2d8+4')
+
+# below this many damage values a direct shifted sum beats the FFT and has no rounding noise
+direct_convolve_size = 64
+
+def damage_pmf(damage, multiplier=1, resistance=0, weakness=0, min_damage=0):
+  """
+  Probability of each damage value 0..max for one damage roll.
+
+  Parameters:
+  - damage: dice expression, e.g. '2d8+4'
+  - multiplier: scale on the rolled total, 2 for a PF2e crit, 0.5 for a basic save
+    (rounded down), 0 for no damage
+  - resistance, weakness: subtracted/added whenever any damage is dealt
+  - min_damage: floor on the rolled damage before resistances, e.g. 1 for PF2e
+  """
+  totals, weights, cumulative = cached_dice_pmf(damage)
+  prob = weights / np.sum(weights)
+
+  dealt = np.floor(multiplier * np.maximum(totals, min_damage)).astype('int')
+  dealt = np.maximum(dealt, 0)
+  # weakness and resistance only apply when the hit actually deals damage
+  dealt = np.where(dealt > 0, np.maximum(dealt + weakness - resistance, 0), 0)
+
+  return np.bincount(dealt, weights=prob)
+
+def degree_damage_pmfs(damage, success_multiplier, resistance=0, weakness=0, min_damage=0):
+  """
+  damage_pmf for every degree of success, padded to a common length.
+
+  Returns an array of shape (len(success_multiplier), max damage + 1).
+  """
+  pmfs = [damage_pmf(damage, multiplier, resistance, weakness, min_damage) if multiplier else np.ones(1)
+          for multiplier in success_multiplier]
+  out = np.zeros((len(pmfs), max(np.size(pmf) for pmf in pmfs)))
+  for k, pmf in enumerate(pmfs):
+    out[k,:np.size(pmf)] = pmf
+  return out
+
+def convolve_last_axis(a, b):
+  """
+  Convolve damage distributions along the last axis, broadcasting the rest.
+  """
+  length = a.shape[-1] + b.shape[-1] - 1
+  if min(a.shape[-1], b.shape[-1]) <= direct_convolve_size:
+    if a.shape[-1] < b.shape[-1]:
+      a, b = b, a
+    out = np.zeros(np.broadcast_shapes(a.shape[:-1], b.shape[:-1]) + (length,))
+    for d in range(b.shape[-1]):
+      out[...,d:d+a.shape[-1]] += a * b[...,d:d+1]
+    return out
+
+  spectrum = np.fft.rfft(a, length, axis=-1) * np.fft.rfft(b, length, axis=-1)
+  return np.clip(np.fft.irfft(spectrum, length, axis=-1), 0, None)
+
+def strike_damage_pmf(table, dc, hit, degree_pmfs):
+  """
+  Damage distribution of one check, mixing degree_pmfs by the chance of each degree.
+
+  Returns an array of shape broadcast(dc, hit) + (max damage + 1,).
+  """
+  probabilities = table.probabilities(dc, hit)
+  return probabilities @ degree_pmfs
+
+def turn_damage(attack_dice, ac, attack_bonus, damage, success_ranges=(-9,0,10), success_multiplier=(0,0,1,2),
+                attack_penalties=(0,-5,-10), resistance=0, weakness=0, min_damage=0, crits_flag=True):
+  """
+  Expected damage and full damage distribution over a turn of independent strikes.
+
+  Parameters:
+  - attack_dice: dice expression for the attack roll, e.g. '1d20'
+  - ac, attack_bonus: DCs and attack modifiers, broadcast against each other
+  - damage: damage expression, or a list with one per strike
+  - success_ranges, success_multiplier: as in dice_stats, the multiplier scales damage
+  - attack_penalties: one entry per strike, e.g. (0,-4,-8) for agile weapons
+  - resistance, weakness, min_damage: passed to damage_pmf, per hit
+
+  Returns (expected, pmf) with expected shaped like broadcast(ac, attack_bonus)
+  and pmf adding a last axis over total damage 0..max.
+  """
+  table = SuccessTable.from_expression(attack_dice, np.asarray(success_ranges), crits_flag)
+  damages = [damage]*len(attack_penalties) if isinstance(damage, str) else list(damage)
+  if len(damages) != len(attack_penalties):
+    raise ValueError(f'Got {len(damages)} damage expressions for {len(attack_penalties)} strikes')
+
+  ac = np.asarray(ac)
+  attack_bonus = np.asarray(attack_bonus)
+  expected = 0
+  pmf = np.ones(np.broadcast_shapes(ac.shape, attack_bonus.shape) + (1,))
+  for strike_damage, penalty in zip(damages, attack_penalties):
+    degree_pmfs = degree_damage_pmfs(strike_damage, success_multiplier, resistance, weakness, min_damage)
+    strike_pmf = strike_damage_pmf(table, ac, attack_bonus + penalty, degree_pmfs)
+    expected = expected + strike_pmf @ np.arange(strike_pmf.shape[-1])
+    pmf = convolve_last_axis(pmf, strike_pmf)
+
+  return expected, pmf
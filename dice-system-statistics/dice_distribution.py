@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+import numpy as np
+
+
+# a distribution is a (totals, weights) pair where totals is a contiguous run of
+# integers and weights[i] is how many ways (or how likely) it is to roll totals[i]
+# keeping totals contiguous means adding two rolls together is just np.convolve
+
+# past this many outcomes the int64 counts would overflow so we swap to probabilities
+max_exact_outcomes = 2**62
+
+def die_pmf(num_sides):
+  """
+  Distribution of a single 1dN roll as integer counts.
+  """
+  totals = np.arange(1,num_sides+1)
+  weights = np.ones(num_sides, dtype='int64')
+  return totals, weights
+
+def trim_pmf(totals, weights):
+  """
+  Drop zero weights from both ends so the first and last totals are the
+  natural min and max that the crit rules act on.
+  """
+  nonzero = np.flatnonzero(weights)
+  if np.size(nonzero) == 0:
+    return totals[:1], weights[:1]
+  return totals[nonzero[0]:nonzero[-1]+1], weights[nonzero[0]:nonzero[-1]+1]
+
+def add_pmf(pmf_a, pmf_b):
+  """
+  Distribution of the sum of two independent rolls.
+  """
+  totals_a, weights_a = pmf_a
+  totals_b, weights_b = pmf_b
+  if(np.issubdtype(weights_a.dtype, np.integer) and np.issubdtype(weights_b.dtype, np.integer)
+     and int(np.sum(weights_a))*int(np.sum(weights_b)) > max_exact_outcomes):
+    weights_a = weights_a / np.sum(weights_a)
+    weights_b = weights_b / np.sum(weights_b)
+  weights = np.convolve(weights_a, weights_b)
+  totals = np.arange(totals_a[0]+totals_b[0], totals_a[0]+totals_b[0]+np.size(weights))
+  return totals, weights
+
+def shift_pmf(pmf, offset):
+  """
+  Distribution of a roll plus a flat modifier.
+  """
+  totals, weights = pmf
+  return totals + offset, weights
+
+def power_pmf(pmf, num_dice):
+  """
+  Distribution of num_dice independent copies of a roll added together, built
+  by repeated squaring so 20d6 only needs a handful of convolutions.
+  """
+  totals, weights = pmf
+  result = (np.zeros(1, dtype='int'), np.ones(1, dtype=weights.dtype))
+  base = pmf
+  while num_dice > 0:
+    if num_dice & 1:
+      result = add_pmf(result, base)
+    num_dice >>= 1
+    if num_dice > 0:
+      base = add_pmf(base, base)
+  return result
+
+def fft_power_pmf(pmf, num_dice):
+  """
+  Same as power_pmf but in probabilities via the FFT, for pools whose counts
+  don't fit in an int64 (e.g. 30d20).
+  """
+  totals, weights = trim_pmf(*pmf)
+  prob = weights / np.sum(weights)
+  prob_ends = prob[0], prob[-1]
+  length = num_dice*(np.size(prob)-1)+1
+  spectrum = np.fft.rfft(prob, length) ** num_dice
+  prob = np.fft.irfft(spectrum, length)
+  # round-off leaves noise of about eps*max on every total, impossible ones
+  # included, so anything below it is dropped like the zeros of power_pmf
+  noise = np.finfo(prob.dtype).eps * length * prob.max()
+  prob[prob < noise] = 0
+  # the natural min and max are possible however deep in the noise, their
+  # weights are known exactly
+  tiny = np.finfo(prob.dtype).tiny
+  prob[0] = max(prob_ends[0] ** num_dice, tiny)
+  prob[-1] = max(prob_ends[1] ** num_dice, tiny)
+  prob /= np.sum(prob)
+  totals = np.arange(num_dice*totals[0], num_dice*totals[0]+length)
+  return trim_pmf(totals, prob)
+
+def dice_pmf(num_dice, num_sides, method='auto'):
+  """
+  Distribution of the sum of num_dice dN.
+
+  Parameters:
+  - num_dice, num_sides: the pool, e.g. 2 and 10 for Draw Steel's 2d10
+  - method: 'exact' for integer counts by convolution, 'fft' for float
+    probabilities, 'auto' picks exact unless the counts would overflow
+
+  Returns (totals, weights) with totals running from num_dice to num_dice*num_sides.
+  """
+  if method == 'auto':
+    method = 'exact' if num_sides**num_dice <= max_exact_outcomes else 'fft'
+
+  if method == 'exact':
+    return power_pmf(die_pmf(num_sides), num_dice)
+  elif method == 'fft':
+    return fft_power_pmf(die_pmf(num_sides), num_dice)
+  else:
+    raise ValueError(f'Unknown pmf method: {method}')
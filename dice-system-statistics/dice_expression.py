@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+
+import re
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from dice_distribution import die_pmf, dice_pmf, add_pmf, shift_pmf, power_pmf, trim_pmf, max_exact_outcomes
+
+
+# dice expressions are terms added or subtracted together, e.g.
+#   1d20+7        PF2e strike
+#   2d10+2        Draw Steel power roll with an edge
+#   2d20kh1       5e advantage (kl1 for disadvantage)
+#   4d6dl1        stat generation, same as 4d6kh3
+#   1d6!          Savage Worlds exploding wild die
+#   2d10+1d4kh1!  any mix of the above
+# keep/drop (kh, kl, dh, dl) and explode (!) go after the die in any order,
+# explosion is applied to each die before deciding which ones are kept
+
+DiceTerm = namedtuple('DiceTerm', ['sign', 'num_dice', 'num_sides', 'keep', 'highest', 'explode'])
+
+# exploding dice are truncated once the chance of exploding again drops below this
+explode_tolerance = 1e-12
+
+term_pattern = re.compile(r'([+-]?)(\d*)d(\d+|%)((?:k[hl]?\d+|d[hl]\d+|!)*)|([+-]?)(\d+)')
+modifier_pattern = re.compile(r'(kh|kl|k|dh|dl)(\d+)|!')
+operator_spaces = re.compile(r'\s*([+-])\s*')
+
+def parse_dice_expression(expression):
+  """
+  Split a dice expression into its dice terms and flat modifier.
+
+  Returns (terms, modifier) where terms is a list of DiceTerm with keep/drop
+  rewritten as keep-highest or keep-lowest, e.g. 4d6dl1 becomes 4d6kh3.
+  """
+  # spaces are only allowed around the + and - between terms, '1d20 7' is an error, not 1d207
+  expr = operator_spaces.sub(r'\1', expression.strip()).lower()
+  if not expr:
+    raise ValueError('Empty dice expression')
+
+  terms = []
+  modifier = 0
+  pos = 0
+  while pos < len(expr):
+    match = term_pattern.match(expr, pos)
+    # every term after the first needs an explicit sign
+    if match is None or match.end() == pos or (pos > 0 and expr[pos] not in '+-'):
+      raise ValueError(f'Could not parse dice expression {expression!r} at {expr[pos:]!r}')
+    pos = match.end()
+
+    if match.group(6) is not None:
+      sign = -1 if match.group(5) == '-' else 1
+      modifier += sign*int(match.group(6))
+      continue
+
+    sign = -1 if match.group(1) == '-' else 1
+    num_dice = int(match.group(2)) if match.group(2) else 1
+    num_sides = 100 if match.group(3) == '%' else int(match.group(3))
+    if num_dice < 1 or num_sides < 1:
+      raise ValueError(f'Dice need at least one die and one side, got {match.group(0)!r}')
+
+    keep = num_dice
+    highest = True
+    explode = False
+    for mod in modifier_pattern.finditer(match.group(4)):
+      if mod.group(0) == '!':
+        if num_sides < 2:
+          raise ValueError(f'Cannot explode a {num_sides} sided die')
+        explode = True
+        continue
+      count = int(mod.group(2))
+      if count > num_dice:
+        raise ValueError(f'Cannot keep or drop {count} of {num_dice} dice')
+      if mod.group(1) in ('kh', 'k'):
+        keep, highest = count, True
+      elif mod.group(1) == 'kl':
+        keep, highest = count, False
+      elif mod.group(1) == 'dl':
+        keep, highest = num_dice-count, True
+      else:
+        keep, highest = num_dice-count, False
+    if keep < 1:
+      raise ValueError(f'Cannot drop every die in {match.group(0)!r}')
+
+    terms.append(DiceTerm(sign, num_dice, num_sides, keep, highest, explode))
+
+  return terms, modifier
+
+def format_dice_expression(terms, modifier=0):
+  """
+  Canonical string for parsed terms, e.g. '2d10+1d4kh1!-1'.
+  """
+  expr = ''
+  for term in terms:
+    expr += '-' if term.sign < 0 else '+'
+    expr += f'{term.num_dice}d{term.num_sides}'
+    if term.keep < term.num_dice:
+      expr += f'k{"h" if term.highest else "l"}{term.keep}'
+    if term.explode:
+      expr += '!'
+  if modifier or not terms:
+    expr += f'{modifier:+d}'
+  return expr.lstrip('+')
+
+def normalize_dice_expression(expression):
+  """
+  Canonical form of a dice expression, equal strings always give equal distributions.
+  """
+  return format_dice_expression(*parse_dice_expression(expression))
+
+def exploding_die_pmf(num_sides, explode_depth=None):
+  """
+  Distribution of an exploding dN, i.e. roll again and add on a max roll.
+
+  The die explodes at most explode_depth times, with the last roll kept as is,
+  so counts stay exact with num_sides**(explode_depth+1) equally likely outcomes.
+  By default the depth is the first one where exploding again is less likely
+  than explode_tolerance.
+  """
+  if explode_depth is None:
+    explode_depth = max(0, math.ceil(-math.log(explode_tolerance) / math.log(num_sides)) - 1)
+
+  # a roll that exploded d times totals d*num_sides + face, each with weight num_sides**(depth-d)
+  depth = np.arange(explode_depth+1)
+  weights = np.zeros((explode_depth+1, num_sides), dtype='int64')
+  weights[:,:-1] = (num_sides ** (explode_depth - depth))[:,None]
+  weights[-1,-1] = 1
+  totals = np.arange(1, (explode_depth+1)*num_sides+1)
+  return totals, weights.flatten()
+
+def keep_pmf(pmf, num_dice, keep, highest=True):
+  """
+  Distribution of the sum of the keep highest (or lowest) of num_dice rolls of pmf.
+
+  Uses order statistics instead of enumerating every roll: faces are visited
+  from best to worst and for each we count how many of the remaining dice show
+  it, with multinomial weights, so the first keep dice placed are the kept ones.
+  """
+  totals, weights = trim_pmf(*pmf)
+  if keep == num_dice:
+    return power_pmf((totals, weights), num_dice)
+
+  exact = np.issubdtype(weights.dtype, np.integer) and int(np.sum(weights))**num_dice <= max_exact_outcomes
+  if not exact:
+    weights = weights / np.sum(weights)
+
+  # dp[j] is the distribution of the kept sum once j dice are placed,
+  # indexed by kept sum minus the smallest possible kept sum
+  offset = keep*totals[0]
+  length = keep*(totals[-1]-totals[0])+1
+  dp = np.zeros((num_dice+1, length), dtype=weights.dtype)
+  dp[0,0] = 1
+
+  order = range(np.size(totals)-1, -1, -1) if highest else range(np.size(totals))
+  for i in order:
+    if weights[i] == 0:
+      continue
+    face = totals[i] - totals[0]
+    new = np.zeros_like(dp)
+    for j in range(num_dice+1):
+      if not dp[j].any():
+        continue
+      for c in range(num_dice-j+1):
+        coef = math.comb(num_dice-j, c) * (int(weights[i])**c if exact else weights[i]**c)
+        shift = min(c, max(0, keep-j)) * face
+        new[j+c,shift:] += coef * dp[j,:length-shift]
+    dp = new
+
+  return trim_pmf(np.arange(offset, offset+length), dp[num_dice])
+
+def negate_pmf(pmf):
+  """
+  Distribution of minus a roll.
+  """
+  totals, weights = pmf
+  return -totals[::-1], weights[::-1]
+
+def dice_term_pmf(term, explode_depth=None):
+  """
+  Distribution of a single parsed DiceTerm.
+  """
+  if term.explode:
+    pmf = keep_pmf(exploding_die_pmf(term.num_sides, explode_depth), term.num_dice, term.keep, term.highest)
+  elif term.keep < term.num_dice:
+    pmf = keep_pmf(die_pmf(term.num_sides), term.num_dice, term.keep, term.highest)
+  else:
+    pmf = dice_pmf(term.num_dice, term.num_sides)
+
+  if term.sign < 0:
+    pmf = negate_pmf(pmf)
+  return pmf
+
+def dice_expression_pmf(expression, explode_depth=None):
+  """
+  Exact distribution of a dice expression like '2d10+1d4kh1!'.
+
+  Returns (totals, weights) in the same form as dice_distribution.dice_pmf, so
+  it can go straight into dice_stats.degree_of_success_ratio.
+  """
+  terms, modifier = parse_dice_expression(expression)
+
+  pmf = (np.zeros(1, dtype='int'), np.ones(1, dtype='int64'))
+  for term in terms:
+    pmf = add_pmf(pmf, dice_term_pmf(term, explode_depth))
+
+  return trim_pmf(*shift_pmf(pmf, modifier))
@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+
+import math
+from collections import namedtuple
+from statistics import NormalDist
+
+import numpy as np
+
+from dice_expression import parse_dice_expression
+from dice_cache import cached_dice_pmf
+
+
+# Monte Carlo counterpart to dice_stats for rules without a closed form, like
+# hero point rerolls or a full turn of strikes with the multiple attack penalty.
+# Rolls are drawn in batched arrays, classified with the same success ranges and
+# crit rule as dice_stats, and trials are run in chunks so memory stays bounded.
+# A chunk holds about chunk_elements rolled dice, so trials with a DC/modifier
+# grid or big dice pools run fewer trials per chunk. Every chunk gets its own
+# child stream of the seed, so the same seed and chunk size always reproduce
+# the same result.
+
+SimulationResult = namedtuple('SimulationResult', ['mean', 'std_error', 'ci_low', 'ci_high', 'trials'])
+
+default_trials = 10**6
+# dice rolled per chunk, about 16MB per int64 array, 1d20 checks run 10**6 trials per chunk
+chunk_elements = 2*10**6
+
+# exploding dice stop after this many explosions, the odds of getting there are nil
+max_explosions = 100
+
+def roll_expression(rng, expression, size):
+  """
+  Draw totals of a dice expression with a numpy Generator, size is the output shape.
+  """
+  size = (size,) if np.isscalar(size) else tuple(size)
+  terms, modifier = parse_dice_expression(expression)
+
+  total = np.full(size, modifier, dtype='int64')
+  for term in terms:
+    rolls = rng.integers(1, term.num_sides+1, size=size+(term.num_dice,))
+    if term.explode:
+      exploding = rolls == term.num_sides
+      for i in range(max_explosions):
+        if not exploding.any():
+          break
+        extra = rng.integers(1, term.num_sides+1, size=np.count_nonzero(exploding))
+        rolls[exploding] += extra
+        exploding[exploding] = extra == term.num_sides
+    if term.keep < term.num_dice:
+      rolls = np.sort(rolls, axis=-1)
+      rolls = rolls[...,-term.keep:] if term.highest else rolls[...,:term.keep]
+    total += term.sign * rolls.sum(axis=-1)
+
+  return total
+
+def natural_limits(expression):
+  """
+  Natural min and max totals, the same rolls the exact engine applies crits to.
+  """
+  totals, weights, cumulative = cached_dice_pmf(expression)
+  return totals[0], totals[-1]
+
+def classify_rolls(totals, margin, success_ranges, crits_flag=True, natural_min=None, natural_max=None):
+  """
+  Degree of success of each total against margin = DC - modifier, broadcasting
+  like numpy, with the same nat min/max crit rule as dice_stats.degree_of_success.
+  """
+  success_ranges = np.asarray(success_ranges)
+  dos = np.searchsorted(success_ranges, totals - margin, side='right')
+  if(crits_flag):
+    if natural_min is not None:
+      dos -= (totals == natural_min) & (dos != 0)
+    if natural_max is not None:
+      dos += (totals == natural_max) & (dos != np.size(success_ranges))
+  return dos
+
+def trial_elements(expression, dc, hit):
+  # dice rolled per trial: every die of the expression, plus the total, for every DC/modifier pair
+  terms, modifier = parse_dice_expression(expression)
+  return np.size(np.asarray(dc) - np.asarray(hit)) * (sum(term.num_dice for term in terms) + 1)
+
+def simulate(trial_fn, trials, seed=None, chunk_size=None, confidence=0.95):
+  """
+  Run trial_fn over trials in chunks and estimate its mean.
+
+  Parameters:
+  - trial_fn: function (rng, n) returning an array whose first axis is the n trials,
+    any trailing axes (e.g. a DC/modifier grid) are estimated separately
+  - trials: total number of trials
+  - seed: int, None or np.random.SeedSequence, each chunk gets a spawned child stream
+  - chunk_size: trials per chunk, by default chunk_elements divided by the
+    trial_fn.elements_per_trial of check_trial and turn_trial (1 if missing),
+    so the arrays of a chunk stay around chunk_elements entries whatever the grid
+  - confidence: level of the normal confidence interval
+
+  Returns a SimulationResult of arrays shaped like one trial's output.
+  """
+  seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+  if chunk_size is None:
+    chunk_size = max(1, chunk_elements // getattr(trial_fn, 'elements_per_trial', 1))
+  num_chunks = math.ceil(trials / chunk_size)
+
+  total = 0
+  total_sq = 0
+  for i, child in enumerate(seed_seq.spawn(num_chunks)):
+    n = min(chunk_size, trials - i*chunk_size)
+    values = np.asarray(trial_fn(np.random.default_rng(child), n), dtype='float64')
+    total = total + values.sum(axis=0)
+    total_sq = total_sq + (values**2).sum(axis=0)
+
+  mean = total / trials
+  variance = np.clip(total_sq - trials*mean**2, 0, None) / max(trials-1, 1)
+  std_error = np.sqrt(variance / trials)
+  z = NormalDist().inv_cdf(0.5 + confidence/2)
+  return SimulationResult(mean, std_error, mean - z*std_error, mean + z*std_error, trials)
+
+def first_paying_degree(success_multiplier):
+  # default reroll threshold, anything that pays nothing is worth rerolling
+  paying = np.flatnonzero(np.asarray(success_multiplier) > 0)
+  return paying[0] if np.size(paying) else 0
+
+def check_trial(expression, dc, hit, success_ranges, success_multiplier, crits_flag=True,
+                rerolls=0, reroll_below=None, keep_better=False):
+  """
+  Trial function for a single check, returning the success_multiplier per trial.
+
+  Parameters:
+  - dc, hit: scalars or arrays that broadcast, e.g. dc_arr[:,None] and hit_arr[None,:]
+  - rerolls: how many times a check below reroll_below can be rerolled (hero points)
+  - reroll_below: degree index to reroll below, defaults to the first degree that pays
+  - keep_better: keep the better of the two rolls (fortune) instead of the new one
+  """
+  margin = np.asarray(dc) - np.asarray(hit)
+  success_multiplier = np.asarray(success_multiplier)
+  natural_min, natural_max = natural_limits(expression)
+  if reroll_below is None:
+    reroll_below = first_paying_degree(success_multiplier)
+
+  def trial(rng, n):
+    shape = (n,) + np.shape(margin)
+    dos = classify_rolls(roll_expression(rng, expression, shape), margin, success_ranges,
+                         crits_flag, natural_min, natural_max)
+    for i in range(rerolls):
+      redo = dos < reroll_below
+      if not redo.any():
+        break
+      new_dos = classify_rolls(roll_expression(rng, expression, np.count_nonzero(redo)),
+                               np.broadcast_to(margin, shape)[redo], success_ranges,
+                               crits_flag, natural_min, natural_max)
+      dos[redo] = np.maximum(new_dos, dos[redo]) if keep_better else new_dos
+    return success_multiplier[dos]
+
+  trial.elements_per_trial = trial_elements(expression, dc, hit)
+  return trial
+
+def turn_trial(expression, dc, hit, success_ranges, success_multiplier, attack_penalties=(0,-5,-10),
+               crits_flag=True, rerolls=0, reroll_below=None, keep_better=False):
+  """
+  Trial function for a full turn of checks, e.g. PF2e Strike-Strike-Strike with
+  the multiple attack penalty, returning the summed success_multiplier per trial.
+
+  rerolls is a per-turn pool (hero points) spent on the first checks that land
+  below reroll_below, the other parameters are as in check_trial.
+  """
+  margin = np.asarray(dc) - np.asarray(hit)
+  success_multiplier = np.asarray(success_multiplier)
+  natural_min, natural_max = natural_limits(expression)
+  if reroll_below is None:
+    reroll_below = first_paying_degree(success_multiplier)
+
+  def trial(rng, n):
+    shape = (n,) + np.shape(margin)
+    full_margin = np.broadcast_to(margin, shape)
+    remaining = np.full(shape, rerolls)
+    total = np.zeros(shape)
+    for penalty in attack_penalties:
+      dos = classify_rolls(roll_expression(rng, expression, shape), margin - penalty, success_ranges,
+                           crits_flag, natural_min, natural_max)
+      redo = (dos < reroll_below) & (remaining > 0)
+      if redo.any():
+        new_dos = classify_rolls(roll_expression(rng, expression, np.count_nonzero(redo)),
+                                 full_margin[redo] - penalty, success_ranges,
+                                 crits_flag, natural_min, natural_max)
+        dos[redo] = np.maximum(new_dos, dos[redo]) if keep_better else new_dos
+        remaining[redo] -= 1
+      total += success_multiplier[dos]
+    return total
+
+  trial.elements_per_trial = trial_elements(expression, dc, hit)
+  return trial
+
+def simulate_check(expression, dc, hit, success_ranges, success_multiplier, trials=default_trials,
+                   seed=None, chunk_size=None, confidence=0.95, **rules):
+  """
+  Estimated expected success_multiplier of a check, see check_trial for the rules.
+  """
+  trial = check_trial(expression, dc, hit, success_ranges, success_multiplier, **rules)
+  return simulate(trial, trials, seed, chunk_size, confidence)
+
+def simulate_turn(expression, dc, hit, success_ranges, success_multiplier, trials=default_trials,
+                  seed=None, chunk_size=None, confidence=0.95, **rules):
+  """
+  Estimated expected total success_multiplier over a turn, see turn_trial for the rules.
+  """
+  trial = turn_trial(expression, dc, hit, success_ranges, success_multiplier, **rules)
+  return simulate(trial, trials, seed, chunk_size, confidence)
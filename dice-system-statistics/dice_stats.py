@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+
+import numpy as np
+
+
+# success ranges follow the same format as arbitrary-dice-stats.py
+#                    roll + mod < DC + first range
+# DC + n range    <= roll + mod < DC + n+1 range
+# DC + last range <= roll + mod
+# so the degree of success of a roll is just how many range edges it has cleared,
+# which is exactly what searchsorted(..., side='right') counts for us
+
+def degree_of_success(roll_arr, success_ranges, dc_arr, hit_arr, crits_flag=True):
+  """
+  Degree of success index for every (DC, modifier, roll) combination.
+
+  Parameters:
+  - roll_arr: sorted roll totals, the first and last entries are the natural min/max
+  - success_ranges: ascending range edges relative to the DC
+  - dc_arr, hit_arr: DCs and to-hit modifiers to evaluate
+  - crits_flag: shift the natural min down and natural max up a degree
+
+  Returns an int array of shape (len(dc_arr), len(hit_arr), len(roll_arr)).
+  """
+  roll_arr = np.asarray(roll_arr)
+  success_ranges = np.asarray(success_ranges)
+  dc_arr = np.atleast_1d(dc_arr)
+  hit_arr = np.atleast_1d(hit_arr)
+
+  margin = roll_arr[None,None,:] + hit_arr[None,:,None] - dc_arr[:,None,None]
+  dos = np.searchsorted(success_ranges, margin, side='right')
+
+  # same crit rule as the loop version: a natural min that isn't already the
+  # worst degree drops one, a natural max that isn't already the best gains one
+  if(crits_flag):
+    dos[:,:,0] -= dos[:,:,0] != 0
+    dos[:,:,-1] += dos[:,:,-1] != np.size(success_ranges)
+
+  return dos
+
+def degree_of_success_counts(roll_arr, success_ranges, dc_arr, hit_arr, crits_flag=True, weights=None):
+  """
+  Number of rolls landing in each degree of success.
+
+  Parameters:
+  - weights: optional weight per entry of roll_arr, e.g. the (totals, weights)
+    from dice_distribution.dice_pmf, defaults to every roll counting once
+
+  Returns an array of shape (len(dc_arr), len(hit_arr), len(success_ranges)+1)
+  with the same dtype as weights.
+  """
+  if weights is None:
+    weights = np.ones(np.size(roll_arr), dtype='int')
+  weights = np.asarray(weights)
+
+  dos = degree_of_success(roll_arr, success_ranges, dc_arr, hit_arr, crits_flag)
+  num_suc_ranges = np.size(success_ranges)+1
+
+  counts = np.zeros(dos.shape[:2] + (num_suc_ranges,), dtype=weights.dtype)
+  for k in range(num_suc_ranges):
+    counts[:,:,k] = np.dot(dos == k, weights)
+
+  return counts
+
+def degree_of_success_ratio(roll_arr, success_ranges, success_multiplier, dc_arr, hit_arr, crits_flag=True, weights=None):
+  """
+  Expected success_multiplier for every (DC, modifier) pair, i.e. the ratio_mat
+  of arbitrary-dice-stats.py computed in one broadcasted pass.
+
+  Returns a float array of shape (len(dc_arr), len(hit_arr)).
+  """
+  counts = degree_of_success_counts(roll_arr, success_ranges, dc_arr, hit_arr, crits_flag, weights)
+
+  # accumulate in the same order as the loop version so results match bit for bit
+  tmp = 0
+  for k in range(counts.shape[-1]):
+    tmp = tmp + success_multiplier[k] * counts[:,:,k]
+
+  if weights is None:
+    return tmp / np.size(roll_arr)
+  return tmp / np.sum(weights)
+
+class SuccessTable:
+  """
+  Degree of success lookup for one dice system and success-range preset.
+
+  Which degree a roll lands in only depends on the margin DC - modifier, so the
+  counts per degree are tabulated once for every margin where they can change,
+  using the cumulative weights of the roll. Any number of (DC, modifier) pairs
+  are then answered with one table lookup each, matching degree_of_success_counts
+  exactly for integer count weights.
+
+  Parameters:
+  - roll_arr, weights: roll distribution, e.g. from dice_distribution.dice_pmf
+  - success_ranges: ascending range edges relative to the DC
+  - crits_flag: shift the natural min down and natural max up a degree
+  """
+
+  def __init__(self, roll_arr, weights, success_ranges, crits_flag=True):
+    self.roll_arr = np.asarray(roll_arr)
+    self.weights = np.asarray(weights)
+    self.success_ranges = np.asarray(success_ranges)
+    self.crits_flag = crits_flag
+    self.num_suc_ranges = np.size(self.success_ranges)+1
+
+    # below min_margin every roll clears every edge, above the last margin none do
+    self.min_margin = self.roll_arr[0] - self.success_ranges[-1]
+    margins = np.arange(self.min_margin, self.roll_arr[-1] - self.success_ranges[0] + 2)
+
+    # weight of rolls at or above each edge: total minus the cumulative weight below it
+    cumulative = np.concatenate(([0], np.cumsum(self.weights)))
+    self.total = cumulative[-1]
+    edges = margins[:,None] + self.success_ranges[None,:]
+    above = self.total - cumulative[np.searchsorted(self.roll_arr, edges, side='left')]
+
+    counts = np.zeros((np.size(margins), self.num_suc_ranges), dtype=self.weights.dtype)
+    counts[:,0] = self.total - above[:,0]
+    counts[:,1:-1] = above[:,:-1] - above[:,1:]
+    counts[:,-1] = above[:,-1]
+
+    # same crit rule as degree_of_success, moving the natural min and max weights
+    if(crits_flag):
+      rows = np.arange(np.size(margins))
+      low = np.searchsorted(self.success_ranges, self.roll_arr[0] - margins, side='right')
+      high = np.searchsorted(self.success_ranges, self.roll_arr[-1] - margins, side='right')
+      move = low != 0
+      counts[rows[move], low[move]] -= self.weights[0]
+      counts[rows[move], low[move]-1] += self.weights[0]
+      if np.size(self.roll_arr) == 1:
+        # the natural min is also the natural max so it starts from its shifted degree
+        high = low - move
+      move = high != self.num_suc_ranges-1
+      counts[rows[move], high[move]] -= self.weights[-1]
+      counts[rows[move], high[move]+1] += self.weights[-1]
+
+    self.count_table = counts
+
+  @classmethod
+  def from_expression(cls, expression, success_ranges, crits_flag=True, cache_dir=None):
+    """
+    Build a table for a dice expression, reusing the cached roll distribution.
+    """
+    from dice_cache import cached_dice_pmf
+    roll_arr, weights, cumulative = cached_dice_pmf(expression, cache_dir=cache_dir)
+    return cls(roll_arr, weights, success_ranges, crits_flag)
+
+  def margin_index(self, dc_arr, hit_arr):
+    margins = np.asarray(dc_arr) - np.asarray(hit_arr)
+    return np.clip(margins - self.min_margin, 0, np.shape(self.count_table)[0]-1)
+
+  def counts(self, dc_arr, hit_arr):
+    """
+    Weight landing in each degree of success, dc_arr and hit_arr broadcast
+    against each other, e.g. dc_arr[:,None] and hit_arr[None,:] for a grid.
+    """
+    return self.count_table[self.margin_index(dc_arr, hit_arr)]
+
+  def probabilities(self, dc_arr, hit_arr):
+    """
+    Probability of each degree of success, last axis is the degree.
+    """
+    return self.counts(dc_arr, hit_arr) / self.total
+
+  def ratio(self, dc_arr, hit_arr, success_multiplier):
+    """
+    Expected success_multiplier, the same value degree_of_success_ratio gives.
+    """
+    # accumulate in the same order as the loop version so results match bit for bit
+    tmp = 0
+    for k in range(self.num_suc_ranges):
+      tmp = tmp + success_multiplier[k] * self.count_table[:,k]
+
+    return (tmp / self.total)[self.margin_index(dc_arr, hit_arr)]
+
+# the systems from the commented out blocks in arbitrary-dice-stats.py
+dice_systems = {
+  'pf2e': {'dice': '1d20', 'success_ranges': [-9,0,10], 'success_multiplier': [0,0.5,1.0,2], 'crits_flag': True},
+  'pf2e-strike': {'dice': '1d20', 'success_ranges': [-9,0,10], 'success_multiplier': [0,0,1,2], 'crits_flag': True},
+  'pbta': {'dice': '2d6', 'success_ranges': [7,10], 'success_multiplier': [0,0,1], 'crits_flag': False},
+  'draw-steel': {'dice': '2d10', 'success_ranges': [12,17], 'success_multiplier': [1,1.5,2], 'crits_flag': False},
+}
@@ -0,0 +1,308 @@
+#!/usr/bin/python3
+
+import io
+import os
+import sys
+import argparse
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from dice_stats import SuccessTable, dice_systems
+from dice_cache import cached_dice_pmf
+from dice_expression import normalize_dice_expression
+from dice_cli import parse_int_range, parse_float_list
+
+
+# sweep dice systems x success-range presets x multiplier presets x DC/modifier
+# grids across a process pool, e.g.
+#   ./dice_sweep.py --dice 1d20 --dice 2d20kh1 --ranges pf2e=-9,0,10 \
+#     --multipliers strike=0,0,1,2 --multipliers spell=0,0.5,1,2 \
+#     --dc 0:61 --mod=-10:51 -o sweep.parquet
+#
+# distributions are built once in the parent and saved as .npy files that every
+# worker memory maps read-only, so tasks only carry a few indices and a DC slice.
+# results are streamed into one output file as tasks finish, in no fixed order.
+
+# DCs per task, small enough to spread a single big grid over every core
+default_dc_chunk = 8
+# parquet rows collected from finished tasks before they are written as one row group
+row_group_rows = 64*1024
+
+# filled in by init_worker in each worker process
+worker_pmfs = None
+worker_tables = {}
+worker_format = None
+
+def init_worker(pmf_paths, output_format):
+  global worker_pmfs, worker_tables, worker_format
+  worker_pmfs = [(np.load(totals_path, mmap_mode='r'), np.load(weights_path, mmap_mode='r'))
+                 for totals_path, weights_path in pmf_paths]
+  worker_tables = {}
+  worker_format = output_format
+
+def output_format(path):
+  if path.endswith('.parquet'):
+    return 'parquet'
+  elif path == '-' or path.endswith('.csv'):
+    return 'csv'
+  raise ValueError(f'Unknown output format for {path}, use .csv or .parquet')
+
+def block_columns(dc_arr, hit_arr, ratio_mat, probabilities, num_degrees):
+  """
+  Flatten one block into dc, modifier, ratio and NaN padded p_degree_k columns.
+  """
+  dc_grid, hit_grid = np.meshgrid(dc_arr, hit_arr, indexing='ij')
+  num_rows = np.size(dc_grid)
+  probs = np.full((num_rows, num_degrees), np.nan)
+  probs[:,:probabilities.shape[-1]] = probabilities.reshape(num_rows, -1)
+  return dc_grid.ravel(), hit_grid.ravel(), ratio_mat.ravel(), probs
+
+def csv_field(text):
+  # quote labels the way the csv module would, so commas in a name don't split the row
+  if any(c in text for c in ',"\r\n'):
+    return '"' + text.replace('"', '""') + '"'
+  return text
+
+def encode_block(labels, columns):
+  """
+  Turn a block into what the parent writes: csv text or a list of column arrays.
+
+  Done in the worker so the parent only does I/O and doesn't cap the speedup.
+  """
+  if worker_format == 'parquet':
+    dc, modifier, ratio, probs = columns
+    return [dc, modifier, ratio] + [probs[:,k] for k in range(probs.shape[1])]
+
+  # the labels go in as literal text of the row format, %s keeps the shortest float repr
+  buffer = io.StringIO()
+  prefix = ','.join(csv_field(label) for label in labels).replace('%', '%%') + ','
+  fmt = prefix + ','.join(['%d', '%d'] + ['%s']*(columns[3].shape[1]+1))
+  np.savetxt(buffer, np.column_stack(columns), fmt=fmt)
+  return buffer.getvalue()
+
+def run_task(task):
+  """
+  Compute and encode one (dice, ranges, multipliers, DC slice) block of the sweep.
+  """
+  labels, dice_idx, ranges_idx, success_ranges, success_multiplier, crits_flag, dc_arr, hit_arr, num_degrees = task
+
+  key = (dice_idx, ranges_idx)
+  if key not in worker_tables:
+    totals, weights = worker_pmfs[dice_idx]
+    worker_tables[key] = SuccessTable(totals, weights, success_ranges, crits_flag)
+  table = worker_tables[key]
+
+  ratio_mat = table.ratio(dc_arr[:,None], hit_arr[None,:], success_multiplier)
+  probabilities = table.probabilities(dc_arr[:,None], hit_arr[None,:])
+  columns = block_columns(dc_arr, hit_arr, ratio_mat, probabilities, num_degrees)
+  return labels, np.size(ratio_mat), encode_block(labels, columns)
+
+class SweepWriter:
+  """
+  Streams encoded sweep blocks into a single .csv or .parquet file.
+
+  Every row is one (dice, ranges, multipliers, DC, modifier) combination, with
+  p_degree_k columns padded with NaN up to the most degrees in the sweep.
+  Parquet blocks are buffered into row groups of about row_group_rows rows,
+  whatever the task size.
+  """
+
+  def __init__(self, path, num_degrees):
+    self.path = path
+    self.format = output_format(path)
+    self.columns = ['dice', 'ranges', 'multipliers', 'dc', 'modifier', 'ratio'] + [f'p_degree_{k}' for k in range(num_degrees)]
+
+    if self.format == 'parquet':
+      import pyarrow as pa
+      import pyarrow.parquet as pq
+      self.pa = pa
+      self.schema = pa.schema([('dice', pa.string()), ('ranges', pa.string()), ('multipliers', pa.string()),
+                               ('dc', pa.int64()), ('modifier', pa.int64()), ('ratio', pa.float64())]
+                              + [(f'p_degree_{k}', pa.float64()) for k in range(num_degrees)])
+      self.writer = pq.ParquetWriter(path, self.schema)
+      self.pending = []
+      self.pending_rows = 0
+    else:
+      self.file = sys.stdout if path == '-' else open(path, 'w')
+      self.file.write(','.join(self.columns) + '\n')
+
+  def write(self, labels, num_rows, block):
+    if self.format == 'parquet':
+      arrays = [self.pa.array([label]*num_rows, self.pa.string()) for label in labels]
+      arrays += [self.pa.array(column) for column in block]
+      self.pending.append(self.pa.Table.from_arrays(arrays, schema=self.schema))
+      self.pending_rows += num_rows
+      if self.pending_rows >= row_group_rows:
+        self.flush()
+    else:
+      self.file.write(block)
+
+  def flush(self):
+    # one row group out of everything buffered so far
+    if self.pending:
+      table = self.pa.concat_tables(self.pending).combine_chunks()
+      self.writer.write_table(table, row_group_size=table.num_rows)
+      self.pending = []
+      self.pending_rows = 0
+
+  def close(self):
+    if self.format == 'parquet':
+      self.flush()
+      self.writer.close()
+    elif self.file is not sys.stdout:
+      self.file.close()
+
+def save_shared_pmfs(dice_list, directory):
+  """
+  Build each distribution once and save it as .npy files workers can memory map.
+  """
+  pmf_paths = []
+  for i, dice in enumerate(dice_list):
+    totals, weights, cumulative = cached_dice_pmf(dice)
+    totals_path = os.path.join(directory, f'totals-{i}.npy')
+    weights_path = os.path.join(directory, f'weights-{i}.npy')
+    np.save(totals_path, totals)
+    np.save(weights_path, weights)
+    pmf_paths.append((totals_path, weights_path))
+  return pmf_paths
+
+def sweep_tasks(dice_list, range_presets, multiplier_presets, dc_arr, hit_arr, range_crits, dc_chunk, num_degrees):
+  """
+  Every compatible (dice, ranges, multipliers) combination split into DC slices,
+  multiplier presets that don't have one value per degree of success are skipped.
+  range_crits maps each range preset name to its crits_flag.
+  """
+  for dice_idx, (ranges_idx, (ranges_name, success_ranges)), (multipliers_name, success_multiplier) in itertools.product(
+      range(len(dice_list)), enumerate(range_presets.items()), multiplier_presets.items()):
+    if np.size(success_multiplier) != np.size(success_ranges)+1:
+      continue
+    for start in range(0, np.size(dc_arr), dc_chunk):
+      labels = (dice_list[dice_idx], ranges_name, multipliers_name)
+      yield (labels, dice_idx, ranges_idx, np.asarray(success_ranges), np.asarray(success_multiplier),
+             range_crits[ranges_name], dc_arr[start:start+dc_chunk], hit_arr, num_degrees)
+
+def sweep(dice_list, range_presets, multiplier_presets, dc_arr, hit_arr, output, crits_flag=None,
+          workers=None, dc_chunk=default_dc_chunk, range_crits=None):
+  """
+  Run the full sweep over a process pool and stream the results to output.
+
+  Parameters:
+  - dice_list: dice expressions, e.g. ['1d20', '2d20kh1']
+  - range_presets: dict of name to success ranges
+  - multiplier_presets: dict of name to success multipliers
+  - dc_arr, hit_arr: DCs and modifiers every combination is evaluated over
+  - output: .csv, .parquet or - for csv on stdout
+  - crits_flag: shift natural min/max a degree for every range preset, None to
+    go by range_crits
+  - workers: number of processes, defaults to os.cpu_count()
+  - dc_chunk: DCs per task
+  - range_crits: dict of range preset name to its crits_flag, e.g. from
+    system_range_presets, presets left out shift natural min/max
+
+  Returns the number of rows written.
+  """
+  dice_list = [normalize_dice_expression(dice) for dice in dice_list]
+  dc_arr = np.asarray(dc_arr)
+  hit_arr = np.asarray(hit_arr)
+  num_degrees = max(np.size(ranges)+1 for ranges in range_presets.values())
+  workers = workers or os.cpu_count()
+  range_crits = {name: (crits_flag if crits_flag is not None else (range_crits or {}).get(name, True))
+                 for name in range_presets}
+
+  writer = SweepWriter(output, num_degrees)
+  rows = 0
+  try:
+    with tempfile.TemporaryDirectory(prefix='dice-sweep-') as directory:
+      pmf_paths = save_shared_pmfs(dice_list, directory)
+      tasks = sweep_tasks(dice_list, range_presets, multiplier_presets, dc_arr, hit_arr, range_crits, dc_chunk, num_degrees)
+
+      with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(pmf_paths, writer.format)) as executor:
+        # keep a couple of tasks per worker in flight so finished blocks never pile up in memory
+        pending = set()
+        for task in tasks:
+          pending.add(executor.submit(run_task, task))
+          while len(pending) >= 2*workers:
+            rows += write_finished(writer, pending)
+        while pending:
+          rows += write_finished(writer, pending)
+  finally:
+    writer.close()
+
+  return rows
+
+def write_finished(writer, pending):
+  # wait for at least one task and write out everything that is done
+  done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+  rows = 0
+  for future in done:
+    pending.remove(future)
+    labels, num_rows, block = future.result()
+    writer.write(labels, num_rows, block)
+    rows += num_rows
+  return rows
+
+def parse_preset(text, parse_values):
+  """
+  'name=v,v,v' or just 'v,v,v', in which case the values are the name.
+  """
+  name, sep, values = text.rpartition('=')
+  return (name if sep else values.replace(',', ' ')), parse_values(values)
+
+def system_presets(key):
+  # one preset per distinct value among the dice_systems, named after the first system using it
+  presets = {}
+  for name, system in dice_systems.items():
+    if not any(np.array_equal(system[key], values) for values in presets.values()):
+      presets[name] = np.array(system[key])
+  return presets
+
+def system_range_presets():
+  """
+  Success range presets of the dice_systems like system_presets, with a dict of
+  each preset's crits_flag. Systems with the same ranges but a different crit
+  rule get a preset each.
+  """
+  presets, crits = {}, {}
+  for name, system in dice_systems.items():
+    if not any(np.array_equal(system['success_ranges'], values) and crits[other] == system['crits_flag']
+               for other, values in presets.items()):
+      presets[name] = np.array(system['success_ranges'])
+      crits[name] = system['crits_flag']
+  return presets, crits
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Parallel degree of success sweep over dice, presets and DC/modifier grids.')
+  parser.add_argument('--dice', action='append', help='dice expression, repeatable (default: every preset system)')
+  parser.add_argument('--ranges', action='append', type=lambda text: parse_preset(text, parse_int_range), help='name=comma separated success ranges, repeatable')
+  parser.add_argument('--multipliers', action='append', type=lambda text: parse_preset(text, parse_float_list), help='name=comma separated success multipliers, repeatable')
+  crits = parser.add_mutually_exclusive_group()
+  crits.add_argument('--crits', dest='crits_flag', action='store_true', default=None,
+                     help='shift natural min/max a degree for every preset (default: as the preset system does, on for --ranges)')
+  crits.add_argument('--no-crits', dest='crits_flag', action='store_false', help='no natural min/max shift for any preset')
+  parser.add_argument('--dc', type=parse_int_range, default=np.arange(10,20), help='DCs, e.g. 10:20 (default)')
+  parser.add_argument('--mod', type=parse_int_range, default=np.arange(0,10), help='modifiers, e.g. 0:10 (default)')
+  parser.add_argument('-o', '--output', default='-', help='.csv, .parquet or - for csv on stdout (default)')
+  parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+  parser.add_argument('--dc-chunk', type=int, default=default_dc_chunk, help=f'DCs per task (default: {default_dc_chunk})')
+  args = parser.parse_args(argv)
+
+  # anything left out comes from the preset systems in dice_stats
+  dice_list = args.dice or sorted({system['dice'] for system in dice_systems.values()})
+  range_presets, range_crits = (dict(args.ranges), None) if args.ranges else system_range_presets()
+  multiplier_presets = dict(args.multipliers) if args.multipliers else system_presets('success_multiplier')
+
+  try:
+    rows = sweep(dice_list, range_presets, multiplier_presets, args.dc, args.mod, args.output,
+                 args.crits_flag, args.workers, args.dc_chunk, range_crits)
+  except ValueError as e:
+    print(f'Error: {e}', file=sys.stderr)
+    return 2
+
+  print(f'{rows} rows written', file=sys.stderr)
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
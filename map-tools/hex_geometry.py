@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+
+import numpy as np
+
+from hex_grid import hex_spacing, grid_shape
+
+
+# hex coordinates for the grid hex_grid draws, so pixels can be mapped to hexes
+# and data attached to them. hexes are addressed in axial coordinates (q, r),
+# cube coordinates add s = -q-r, pointy topped like the grid:
+#   q grows to the right, r grows down and to the right, s up and to the right
+# hex (col, row) of create_hexagon_grid is axial (col//2 - row, 2*row + col%2),
+# its centers come from the same hex_spacing, so pixel_to_axial of a point gives
+# the hex around it. near the right and bottom edges that can be a hex the grid
+# doesn't draw (e.g. col == ncols), HexMap.hex_at_pixel also says whether the
+# hex is on the grid.
+#
+# every function takes numbers or numpy arrays and broadcasts, so a million
+# points convert in one call. HexMap keeps per hex data in (rows, cols) arrays
+# of the grid for O(1) lookups by axial coordinates.
+
+# axial steps to the six neighbors, clockwise from the east
+axial_directions = np.array([(1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)])
+
+def axial_to_cube(q, r):
+  q, r = np.asarray(q), np.asarray(r)
+  return q, r, -q-r
+
+def cube_to_axial(q, r, s):
+  return np.asarray(q), np.asarray(r)
+
+def grid_to_axial(col, row):
+  """
+  Axial coordinates of hex (col, row) of create_hexagon_grid.
+  """
+  col, row = np.asarray(col), np.asarray(row)
+  return col//2 - row, 2*row + col%2
+
+def axial_to_grid(q, r):
+  """
+  (col, row) of create_hexagon_grid for axial coordinates, inverse of grid_to_axial.
+  """
+  q, r = np.asarray(q), np.asarray(r)
+  return 2*q + r, r//2
+
+def axial_to_pixel(q, r, hex_size):
+  """
+  Pixel centers of hexes, the same as hex_grid.hex_center of their (col, row).
+  """
+  horizontal_spacing, vertical_spacing = hex_spacing(hex_size)
+  q, r = np.asarray(q), np.asarray(r)
+  return (2*q + r) * horizontal_spacing, r * (vertical_spacing / 2)
+
+def cube_round(q, r, s):
+  """
+  Nearest hex to fractional cube coordinates, as integer axial (q, r).
+  """
+  q, r, s = np.asarray(q, dtype='float'), np.asarray(r, dtype='float'), np.asarray(s, dtype='float')
+  rq, rr, rs = np.round(q), np.round(r), np.round(s)
+  dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+  # the coordinate that moved most is rebuilt from the other two so q+r+s stays 0
+  fix_q = (dq > dr) & (dq > ds)
+  fix_r = ~fix_q & (dr > ds)
+  rq = np.where(fix_q, -rr-rs, rq)
+  rr = np.where(fix_r, -rq-rs, rr)
+  return rq.astype('int64'), rr.astype('int64')
+
+def pixel_to_axial(x, y, hex_size):
+  """
+  Axial coordinates of the hexes containing pixels (x, y), not checked
+  against any grid, see HexMap.hex_at_pixel.
+  """
+  horizontal_spacing, vertical_spacing = hex_spacing(hex_size)
+  r = np.asarray(y, dtype='float') / (vertical_spacing / 2)
+  q = np.asarray(x, dtype='float') / (2*horizontal_spacing) - r/2
+  return cube_round(q, r, -q-r)
+
+def hex_neighbors(q, r):
+  """
+  Axial coordinates of the six neighbors, arrays of shape q.shape + (6,).
+  """
+  q, r = np.asarray(q), np.asarray(r)
+  return q[...,None] + axial_directions[:,0], r[...,None] + axial_directions[:,1]
+
+def hex_distance(q1, r1, q2, r2):
+  """
+  Number of steps between hexes.
+  """
+  dq, dr = np.asarray(q1) - np.asarray(q2), np.asarray(r1) - np.asarray(r2)
+  return (np.abs(dq) + np.abs(dr) + np.abs(dq + dr)) // 2
+
+def hex_ring(q, r, radius):
+  """
+  Axial coordinates of the 6*radius hexes exactly radius steps from (q, r),
+  clockwise from the northwest corner.
+  """
+  if radius == 0:
+    return np.array([q]), np.array([r])
+  # side k starts at the corner radius steps in direction k+4 and walks in direction k
+  steps = np.repeat(axial_directions, radius, axis=0)
+  corners = np.array([q, r]) + radius*np.roll(axial_directions, -4, axis=0)
+  along = np.tile(np.arange(radius), 6)[:,None] * steps
+  ring = np.repeat(corners, radius, axis=0) + along
+  return ring[:,0], ring[:,1]
+
+def hex_range(q, r, radius):
+  """
+  Axial coordinates of every hex within radius steps of (q, r), 3*radius*(radius+1)+1 of them.
+  """
+  dq, dr = np.meshgrid(np.arange(-radius, radius+1), np.arange(-radius, radius+1), indexing='ij')
+  inside = np.abs(dq + dr) <= radius
+  return q + dq[inside], r + dr[inside]
+
+def hex_line(q1, r1, q2, r2):
+  """
+  Axial coordinates of the hexes on the straight line between two hexes,
+  both ends included, distance+1 of them.
+
+  Points exactly on an edge go to the same side every time, the ends are
+  nudged by a tiny fixed offset as usual for hex lines.
+  """
+  n = int(hex_distance(q1, r1, q2, r2))
+  t = np.linspace(0, 1, n+1) if n > 0 else np.zeros(1)
+  eps = (1e-6, 2e-6)
+  q = (q1 + eps[0]) + (q2 - q1)*t
+  r = (r1 + eps[1]) + (r2 - r1)*t
+  return cube_round(q, r, -q-r)
+
+class HexMap:
+  """
+  Per hex data of a hex_grid grid of shape (cols, rows), one array of shape
+  (rows, cols) per layer.
+
+  Hexes are looked up by axial coordinates with index arithmetic, so reading
+  or writing any number of hexes is a numpy fancy index. Coordinates off the
+  grid read as the layer's fill value and are ignored on writes.
+  """
+
+  def __init__(self, cols, rows, hex_size=1):
+    self.cols = cols
+    self.rows = rows
+    self.hex_size = hex_size
+    self.layers = {}
+    self.fills = {}
+
+  @classmethod
+  def for_image(cls, width, height, hex_size):
+    """
+    HexMap of every hex create_hexagon_grid(width, height, hex_size) draws.
+    """
+    cols, rows = grid_shape(width, height, hex_size)
+    return cls(cols, rows, hex_size)
+
+  @property
+  def shape(self):
+    return self.rows, self.cols
+
+  def add_layer(self, name, dtype='float', fill=0):
+    self.layers[name] = np.full(self.shape, fill, dtype=dtype)
+    self.fills[name] = fill
+    return self.layers[name]
+
+  def __getitem__(self, name):
+    return self.layers[name]
+
+  def __contains__(self, name):
+    return name in self.layers
+
+  def in_bounds(self, q, r):
+    col, row = axial_to_grid(q, r)
+    return (col >= 0) & (col < self.cols) & (row >= 0) & (row < self.rows)
+
+  def index(self, q, r):
+    """
+    Flat index into the layers of each hex, -1 off the grid.
+    """
+    col, row = axial_to_grid(q, r)
+    inside = self.in_bounds(q, r)
+    return np.where(inside, row*self.cols + col, -1)
+
+  def axial(self, index=None):
+    """
+    Axial coordinates of flat indices, of every hex when left out.
+    """
+    index = np.arange(self.rows*self.cols) if index is None else np.asarray(index)
+    return grid_to_axial(index % self.cols, index // self.cols)
+
+  def get(self, name, q, r):
+    layer = self.layers[name]
+    index = self.index(q, r)
+    values = layer.ravel()[np.maximum(index, 0)]
+    return np.where(index >= 0, values, np.asarray(self.fills[name], dtype=layer.dtype))
+
+  def set(self, name, q, r, values):
+    index = self.index(q, r)
+    inside = index >= 0
+    values = np.broadcast_to(values, np.shape(index))
+    self.layers[name].ravel()[index[inside]] = values[inside]
+
+  def neighbors(self, q, r):
+    """
+    Neighbors of each hex as in hex_neighbors, with a mask of those on the grid.
+    """
+    nq, nr = hex_neighbors(q, r)
+    return nq, nr, self.in_bounds(nq, nr)
+
+  def hex_at_pixel(self, x, y):
+    """
+    Axial coordinates of the hexes under pixels, with a mask of those on the grid.
+    """
+    q, r = pixel_to_axial(x, y, self.hex_size)
+    return q, r, self.in_bounds(q, r)
+
+  def line_of_sight(self, name, q1, r1, q2, r2):
+    """
+    True when no hex strictly between the two has a truthy value in layer
+    name, hexes off the grid block the line.
+    """
+    q, r = hex_line(q1, r1, q2, r2)
+    q, r = q[1:-1], r[1:-1]
+    return bool(np.all(self.in_bounds(q, r)) and not np.any(self.get(name, q, r)))
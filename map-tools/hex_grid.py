@@ -0,0 +1,266 @@
+#!/usr/bin/python3
+
+import os
+import math
+import zlib
+import struct
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+# hexagonal grid overlays, shared by hexagonal-grid.py and anything that needs
+# the grid's geometry. hexes are pointy topped with their centers on columns
+# hex_size*sqrt(3)/2 apart, every other column shifted down half a row of
+# 3*hex_size, so (col, row) is hex (col, row) of create_hexagon_grid.
+#
+# poster sized maps are rendered tile by tile, each tile only drawing the hexes
+# that reach into it, and streamed to disk so peak memory follows the tile size
+# instead of the map size:
+#   - write_png_tiled streams rows of tiles into one png
+#   - write_tiff_tiled writes a tiled tiff through tifffile
+#   - write_tile_pyramid writes a z/x/y directory of png tiles for map viewers
+
+default_tile_size = 256
+# hex masks draw_hexagons keeps for reuse per call
+mask_cache_size = 4096
+
+def hex_spacing(hex_size):
+  """
+  Horizontal distance between columns and vertical distance between rows.
+  """
+  # rows are sqrt(3)*hex_height apart rather than 3*hex_size, the rounding
+  # differs and vertices land on whole pixels, so keep the original math
+  hex_height = math.sqrt(3) * hex_size
+  return hex_size * math.sqrt(3)/2, hex_height * math.sqrt(3)
+
+def grid_shape(width, height, hex_size):
+  """
+  Number of (columns, rows) of hexes covering a width x height image.
+  """
+  horizontal_spacing, vertical_spacing = hex_spacing(hex_size)
+  return int(width // horizontal_spacing) + 1, int(height // vertical_spacing) + 1
+
+def hex_center(col, row, hex_size):
+  horizontal_spacing, vertical_spacing = hex_spacing(hex_size)
+  x = col * horizontal_spacing
+  y = row * vertical_spacing
+
+  # Offset every other column
+  if col % 2 == 1:
+    y += vertical_spacing / 2
+  return x, y
+
+def hex_vertex_offsets(hex_size):
+  """
+  Offsets of the six vertices from a hex center as a (6, 2) array, the same
+  floats hex_vertices adds to the center.
+  """
+  offsets = []
+  for i in range(6):
+    angle_deg = 60 * i - 30
+    angle_rad = math.pi / 180 * angle_deg
+    offsets.append((hex_size * math.cos(angle_rad), hex_size * math.sin(angle_rad)))
+  return np.array(offsets)
+
+def hex_vertices(x, y, hex_size):
+  return [(x + dx, y + dy) for dx, dy in hex_vertex_offsets(hex_size).tolist()]
+
+def hex_centers(cols, rows, hex_size):
+  """
+  Centers of hexes cols x rows as an (n, 2) array, row by row.
+  """
+  horizontal_spacing, vertical_spacing = hex_spacing(hex_size)
+  col, row = np.meshgrid(np.asarray(cols), np.asarray(rows))
+  x = col * horizontal_spacing
+  y = row * vertical_spacing
+  # Offset every other column
+  y = np.where(col % 2 == 1, y + vertical_spacing / 2, y)
+  return np.column_stack([x.ravel(), y.ravel()])
+
+def hexes_in_box(x0, y0, x1, y1, shape, hex_size, margin=0):
+  """
+  Column and row ranges of the hexes whose outline (plus margin) can reach
+  into the box x0 <= x < x1, y0 <= y < y1.
+  """
+  ncols, nrows = shape
+  horizontal_spacing, vertical_spacing = hex_spacing(hex_size)
+  reach = hex_size + margin
+  cols = range(max(0, math.floor((x0 - reach) / horizontal_spacing)),
+               min(ncols, math.ceil((x1 + reach) / horizontal_spacing) + 1))
+  rows = range(max(0, math.floor((y0 - reach) / vertical_spacing) - 1),
+               min(nrows, math.ceil((y1 + reach) / vertical_spacing) + 1))
+  return cols, rows
+
+def draw_hexagons(img, cols, rows, hex_size, size, origin=(0, 0), line_color='black', line_width=2):
+  """
+  Outline hexes cols x rows of a grid image of the given size onto img,
+  whose top left is at origin in grid pixels.
+
+  ImageDraw.polygon with width > 1 masks every outline with a polygon fill
+  the size of the whole image, which made the grid cost image area times
+  hexes. Here each hex is drawn on a mask just big enough for it, placed at
+  the same whole pixel offset and clipped to the same image bounds as on the
+  full image, so the pixels are the same. The masks are or-ed into one mask
+  of img with numpy and the line color is pasted through it once. PIL
+  truncates vertices toward zero, so a hex mask never starts left of or
+  above a vertex that is positive on the full image.
+
+  Hexes down a column share their x coordinates, and for most sizes their
+  y coordinates repeat every row up to whole pixels too, so masks are reused
+  for hexes whose vertices sit at exactly the same place within their mask.
+  """
+  width, height = size
+  ox, oy = origin
+  vertices = hex_centers(cols, rows, hex_size)[:,None,:] + hex_vertex_offsets(hex_size)[None,:,:]
+  pad = line_width + 2
+  lo = np.maximum(np.floor(vertices.min(axis=1)).astype('int64') - pad, 0)
+  hi = np.minimum(np.ceil(vertices.max(axis=1)).astype('int64') + pad, [width, height])
+  # subtracting whole pixels from the vertices is exact
+  local = vertices - lo[:,None,:]
+
+  grid = np.zeros((img.height, img.width), dtype='bool')
+  masks = {}
+  for corners, (mx0, my0), (mx1, my1) in zip(local, lo.tolist(), hi.tolist()):
+    # the part of the hex mask that lands on img
+    x0, y0 = max(mx0, ox), max(my0, oy)
+    x1, y1 = min(mx1, ox + img.width), min(my1, oy + img.height)
+    if x1 <= x0 or y1 <= y0:
+      continue
+    key = (corners.tobytes(), mx1 - mx0, my1 - my0)
+    mask = masks.get(key)
+    if mask is None:
+      mask_img = Image.new('L', (mx1 - mx0, my1 - my0), 0)
+      ImageDraw.Draw(mask_img).polygon(corners.ravel().tolist(), outline=255, width=line_width)
+      mask = np.asarray(mask_img) > 0
+      if len(masks) < mask_cache_size:
+        masks[key] = mask
+    grid[y0 - oy:y1 - oy, x0 - ox:x1 - ox] |= mask[y0 - my0:y1 - my0, x0 - mx0:x1 - mx0]
+  img.paste(line_color, (0, 0), Image.fromarray(grid.view('uint8') * np.uint8(255)))
+
+def create_hexagon_grid(width, height, hex_size, line_color='black', line_width=2):
+  """
+  Create a hexagonal grid PNG image.
+
+  Parameters:
+  - width, height: Dimensions of the output image
+  - hex_size: Radius of the hexagon (distance from center to vertex)
+  - line_color: Color of the grid lines
+  - line_width: Width of the grid lines
+  """
+  ncols, nrows = grid_shape(width, height, hex_size)
+
+  # Create blank image
+  img = Image.new('RGBA', (width, height), (0,0,0,0))
+  draw_hexagons(img, range(ncols), range(nrows), hex_size, (width, height), line_color=line_color,
+                line_width=line_width)
+  return img
+
+def render_tile(x0, y0, x1, y1, width, height, hex_size, line_color='black', line_width=2):
+  """
+  Pixels x0..x1-1, y0..y1-1 of create_hexagon_grid(width, height, ...) as an RGBA image.
+  """
+  shape = grid_shape(width, height, hex_size)
+  cols, rows = hexes_in_box(x0, y0, x1, y1, shape, hex_size, line_width)
+  img = Image.new('RGBA', (x1 - x0, y1 - y0), (0,0,0,0))
+  draw_hexagons(img, cols, rows, hex_size, (width, height), (x0, y0), line_color, line_width)
+  return img
+
+def iter_tiles(width, height, tile_size=default_tile_size):
+  """
+  Boxes (x0, y0, x1, y1) of the tiles covering the image, row by row.
+  """
+  for y0 in range(0, height, tile_size):
+    for x0 in range(0, width, tile_size):
+      yield x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height)
+
+def png_chunk(kind, payload):
+  return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+
+def write_png_tiled(path, width, height, hex_size, line_color='black', line_width=2, tile_size=default_tile_size):
+  """
+  Render the grid tile by tile into an RGBA png, one row of tiles in memory at a time.
+  """
+  compressor = zlib.compressobj(6)
+  with open(path, 'wb') as f:
+    f.write(b'\x89PNG\r\n\x1a\n')
+    f.write(png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+    for y0 in range(0, height, tile_size):
+      y1 = min(y0 + tile_size, height)
+      # each scanline starts with filter type 0
+      band = np.zeros((y1 - y0, 1 + 4*width), dtype='uint8')
+      for x0 in range(0, width, tile_size):
+        x1 = min(x0 + tile_size, width)
+        tile = render_tile(x0, y0, x1, y1, width, height, hex_size, line_color, line_width)
+        band[:, 1 + 4*x0:1 + 4*x1] = np.asarray(tile).reshape(y1 - y0, -1)
+      data = compressor.compress(band.tobytes())
+      if data:
+        f.write(png_chunk(b'IDAT', data))
+    f.write(png_chunk(b'IDAT', compressor.flush()))
+    f.write(png_chunk(b'IEND', b''))
+
+def write_tiff_tiled(path, width, height, hex_size, line_color='black', line_width=2, tile_size=default_tile_size):
+  """
+  Render the grid into a tiled RGBA tiff, one tile in memory at a time, needs tifffile.
+
+  tiff tiles are a multiple of 16 pixels, so tile_size is rounded up to one.
+  """
+  import tifffile
+
+  tile_size = -(-tile_size // 16) * 16
+
+  def tiles():
+    # tifffile wants full tiles, edge tiles are padded with transparent pixels
+    for x0, y0, x1, y1 in iter_tiles(width, height, tile_size):
+      tile = np.zeros((tile_size, tile_size, 4), dtype='uint8')
+      tile[:y1 - y0, :x1 - x0] = np.asarray(render_tile(x0, y0, x1, y1, width, height, hex_size, line_color, line_width))
+      yield tile
+
+  tifffile.imwrite(path, tiles(), shape=(height, width, 4), dtype='uint8', tile=(tile_size, tile_size),
+                   photometric='rgb', extrasamples=['unassalpha'], compression='zlib')
+
+def pyramid_zoom(width, height, tile_size=default_tile_size):
+  """
+  Zoom level where one pyramid pixel is one image pixel, zoom 0 is a single tile.
+  """
+  return max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+
+def write_tile_pyramid(directory, width, height, hex_size, line_color='black', line_width=2,
+                       tile_size=default_tile_size):
+  """
+  Render the grid into directory/z/x/y.png tiles for slippy map viewers.
+
+  The deepest zoom is rendered tile by tile at full resolution, every zoom
+  above it is built from the four tiles under each tile, read back from disk,
+  so only a handful of tiles are in memory at a time. Tiles past the edge of
+  the image are left out.
+
+  Returns the deepest zoom level.
+  """
+  max_zoom = pyramid_zoom(width, height, tile_size)
+
+  def tile_path(z, x, y):
+    return os.path.join(directory, str(z), str(x), f'{y}.png')
+
+  for x0, y0, x1, y1 in iter_tiles(width, height, tile_size):
+    tile = Image.new('RGBA', (tile_size, tile_size), (0,0,0,0))
+    tile.paste(render_tile(x0, y0, x1, y1, width, height, hex_size, line_color, line_width), (0, 0))
+    path = tile_path(max_zoom, x0 // tile_size, y0 // tile_size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tile.save(path)
+
+  for z in range(max_zoom - 1, -1, -1):
+    scale = tile_size * 2**(max_zoom - z)
+    for x in range(-(-width // scale)):
+      for y in range(-(-height // scale)):
+        merged = Image.new('RGBA', (2*tile_size, 2*tile_size), (0,0,0,0))
+        for dx in range(2):
+          for dy in range(2):
+            child = tile_path(z + 1, 2*x + dx, 2*y + dy)
+            if os.path.exists(child):
+              with Image.open(child) as img:
+                merged.paste(img, (dx*tile_size, dy*tile_size))
+        path = tile_path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        merged.resize((tile_size, tile_size), Image.LANCZOS).save(path)
+  return max_zoom
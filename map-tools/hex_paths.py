@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+
+import math
+import heapq
+
+import numpy as np
+
+from hex_geometry import hex_neighbors
+
+
+# travel over a HexMap with a terrain cost layer, e.g. days to cross each hex:
+#   - shortest_path, A* between two hexes
+#   - travel_times, Dijkstra from any number of sources at once, e.g. days from
+#     the nearest settlement for every hex, and which settlement that is
+#   - movement_range, every hex reachable within a budget
+# moving into a hex costs that hex's value, the hex a trip starts from is free,
+# and hexes with a cost of inf or nan (or <= 0) can't be entered.
+#
+# the neighbors of every hex are worked out once per map with the hex_geometry
+# functions and kept as flat index lists, and the frontier is a heapq of
+# (cost, index), so the loops only touch python lists and stop as soon as the
+# goal or budget is reached.
+
+class HexPathfinder:
+  """
+  Shortest paths over a cost layer of a HexMap.
+
+  Costs are read from the layer on every query, so edits to the layer show
+  up in the next one. Hexes are given as axial (q, r).
+  """
+
+  def __init__(self, hexmap, layer='cost'):
+    self.hexmap = hexmap
+    self.layer = layer
+    q, r = hexmap.axial()
+    self.q = q.tolist()
+    self.r = r.tolist()
+    nq, nr = hex_neighbors(q, r)
+    # flat index of each of the six neighbors of every hex, -1 off the grid
+    self.neighbors = hexmap.index(nq, nr).ravel().tolist()
+
+  def costs(self):
+    """
+    Cost of entering each hex by flat index, inf where it can't be entered,
+    as an array.
+    """
+    cost = np.asarray(self.hexmap[self.layer], dtype='float').ravel()
+    return np.where(np.isfinite(cost) & (cost > 0), cost, np.inf)
+
+  def index(self, q, r):
+    index = int(self.hexmap.index(q, r))
+    if index < 0:
+      raise ValueError(f'Hex ({q}, {r}) is off the map')
+    return index
+
+  def shortest_path(self, start, goal):
+    """
+    Cheapest path between two hexes with A*.
+
+    The heuristic is the hex distance times the cheapest hex on the map, so
+    the path found is always a cheapest one.
+
+    Returns (path, cost), path a list of (q, r) from start to goal, or
+    (None, inf) when the goal can't be reached.
+    """
+    s, g = self.index(*start), self.index(*goal)
+    cost = self.costs()
+    step = float(cost.min()) if np.isfinite(cost).any() else 0.0
+    cost = cost.tolist()
+    neighbors = self.neighbors
+    qs, rs = self.q, self.r
+    gq, gr = qs[g], rs[g]
+
+    def h(i):
+      dq, dr = qs[i] - gq, rs[i] - gr
+      return step * ((abs(dq) + abs(dr) + abs(dq + dr)) // 2)
+
+    dist = {s: 0.0}
+    came_from = {s: -1}
+    frontier = [(h(s), 0.0, s)]
+    while frontier:
+      _, d, u = heapq.heappop(frontier)
+      if u == g:
+        break
+      if d > dist[u]:
+        continue
+      for v in neighbors[6*u:6*u+6]:
+        if v < 0:
+          continue
+        nd = d + cost[v]
+        if nd < dist.get(v, math.inf):
+          dist[v] = nd
+          came_from[v] = u
+          heapq.heappush(frontier, (nd + h(v), nd, v))
+    if g not in dist:
+      return None, math.inf
+
+    path = []
+    i = g
+    while i >= 0:
+      path.append((qs[i], rs[i]))
+      i = came_from[i]
+    return path[::-1], dist[g]
+
+  def travel_times(self, sources, max_cost=math.inf, start_costs=None):
+    """
+    Cheapest cost from the nearest of several sources to every hex, Dijkstra
+    with all sources in the frontier at once.
+
+    Parameters:
+    - sources: list of (q, r)
+    - max_cost: stop expanding past this cost, hexes further out stay inf
+    - start_costs: cost already spent at each source, zeros by default
+
+    Returns (times, nearest) arrays of the HexMap's shape, nearest holds the
+    index into sources of the cheapest source for each hex, -1 where unreached.
+    """
+    cost = self.costs().tolist()
+    neighbors = self.neighbors
+    n = len(cost)
+    dist = [math.inf]*n
+    nearest = [-1]*n
+    start_costs = start_costs if start_costs is not None else [0.0]*len(sources)
+
+    frontier = []
+    for k, ((q, r), c) in enumerate(zip(sources, start_costs)):
+      i = self.index(q, r)
+      if c < dist[i]:
+        dist[i] = float(c)
+        nearest[i] = k
+        frontier.append((float(c), i))
+    heapq.heapify(frontier)
+
+    while frontier:
+      d, u = heapq.heappop(frontier)
+      if d > dist[u]:
+        continue
+      source = nearest[u]
+      for v in neighbors[6*u:6*u+6]:
+        if v < 0:
+          continue
+        nd = d + cost[v]
+        if nd < dist[v] and nd <= max_cost:
+          dist[v] = nd
+          nearest[v] = source
+          heapq.heappush(frontier, (nd, v))
+
+    shape = self.hexmap.shape
+    return np.array(dist).reshape(shape), np.array(nearest).reshape(shape)
+
+  def movement_range(self, start, budget):
+    """
+    Every hex reachable from start for at most budget, a flood fill that
+    never looks past the budget.
+
+    Returns (q, r, cost) arrays of the reachable hexes, start included.
+    """
+    s = self.index(*start)
+    cost = self.costs().tolist()
+    neighbors = self.neighbors
+    dist = {s: 0.0}
+    frontier = [(0.0, s)]
+    while frontier:
+      d, u = heapq.heappop(frontier)
+      if d > dist[u]:
+        continue
+      for v in neighbors[6*u:6*u+6]:
+        if v < 0:
+          continue
+        nd = d + cost[v]
+        if nd <= budget and nd < dist.get(v, math.inf):
+          dist[v] = nd
+          heapq.heappush(frontier, (nd, v))
+
+    index = np.fromiter(dist.keys(), dtype='int64', count=len(dist))
+    q, r = self.hexmap.axial(index)
+    return q, r, np.fromiter(dist.values(), dtype='float', count=len(dist))
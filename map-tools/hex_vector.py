@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+
+import zlib
+
+import numpy as np
+from PIL import ImageColor
+
+from hex_grid import grid_shape, hex_centers, hex_vertex_offsets
+from hex_geometry import grid_to_axial, hex_neighbors, HexMap
+
+
+# the grid create_hexagon_grid draws as svg or pdf paths, so it prints sharp at
+# any dpi without rendering a bitmap. every edge shared by two hexes is written
+# once: a hex only draws its edges toward neighbors that come after it (or are
+# off the grid), and its consecutive edges are joined into one path, e.g.
+#   M46.77,-9l15.59,-9 15.59,9 0,18 -15.59,9
+# for a hex drawing four edges. the file is written row of hexes by row of
+# hexes, so memory doesn't grow with the grid.
+#
+# edge d of a hex runs from vertex d to vertex d+1 of hex_vertex_offsets and
+# faces hex_geometry.axial_directions[d]
+
+# decimals of the coordinates written out
+vector_decimals = 2
+
+def edge_runs(cols, row, shape):
+  """
+  Edges one row of hexes draws, as runs of consecutive edges.
+
+  Returns (hex, start, length) int arrays, one entry per run: the position
+  of the hex in cols, its first edge and the number of edges.
+  """
+  hexmap = HexMap(*shape)
+  col = np.asarray(cols)
+  q, r = grid_to_axial(col, row)
+  own = hexmap.index(q, r)
+  nq, nr = hex_neighbors(q, r)
+  neighbor = hexmap.index(nq, nr)
+  drawn = (neighbor < 0) | (neighbor > own[:,None])
+
+  # a run starts at a drawn edge whose previous edge (around the hex) isn't drawn
+  starts = drawn & ~np.roll(drawn, 1, axis=1)
+  hexes, start = np.nonzero(starts)
+  length = np.zeros(np.size(hexes), dtype='int64')
+  for k in range(6):
+    # count drawn edges from the start until the first gap
+    still = drawn[hexes, (start + k) % 6]
+    if k > 0:
+      still &= length == k
+    length += still
+  # hexes drawing all six edges have no start, they are one closed run
+  full = np.nonzero(drawn.all(axis=1))[0]
+  hexes = np.concatenate([hexes, full])
+  start = np.concatenate([start, np.zeros(np.size(full), dtype='int64')])
+  length = np.concatenate([length, np.full(np.size(full), 6)])
+  return hexes, start, length
+
+def grid_rows(width, height, hex_size):
+  """
+  For every row of the grid: the centers of its hexes, the row and its edge_runs.
+  """
+  shape = grid_shape(width, height, hex_size)
+  ncols, nrows = shape
+  cols = np.arange(ncols)
+  for row in range(nrows):
+    yield hex_centers(cols, [row], hex_size), row, edge_runs(cols, row, shape)
+
+def hex_label(col, row, labels):
+  if labels == 'axial':
+    q, r = grid_to_axial(col, row)
+    return f'{q},{r}'
+  # hex crawl style column then row, e.g. 0312
+  return f'{col:02d}{row:02d}'
+
+def coord(value):
+  # shortest text for a coordinate, -0 and trailing zeros dropped
+  text = f'{value:.{vector_decimals}f}'.rstrip('0').rstrip('.')
+  return '0' if text == '-0' else text
+
+def write_svg(path, width, height, hex_size, line_color='black', line_width=2, labels=None, font_size=None):
+  """
+  Write the grid as an svg, one path per row of hexes.
+
+  Parameters:
+  - width, height, hex_size: as in create_hexagon_grid, in svg user units
+  - line_color: any svg color
+  - line_width: stroke width
+  - labels: None, 'grid' for column and row (0312) or 'axial' for q,r at each hex center
+  - font_size: label size, hex_size/3 by default
+  """
+  offsets = hex_vertex_offsets(hex_size)
+  # relative step along each edge
+  steps = [f'{coord(dx)},{coord(dy)}' for dx, dy in (np.roll(offsets, -1, axis=0) - offsets)]
+  font_size = font_size or hex_size/3
+
+  with open(path, 'w') as f:
+    f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">\n')
+    f.write(f'<g fill="none" stroke="{line_color}" stroke-width="{line_width}" stroke-linejoin="round">\n')
+    for centers, _, (hexes, start, length) in grid_rows(width, height, hex_size):
+      d = []
+      firsts = (centers[hexes] + offsets[start]).tolist()
+      for (x, y), s, n in zip(firsts, start.tolist(), length.tolist()):
+        d.append(f'M{coord(x)},{coord(y)}l' + ' '.join(steps[(s + k) % 6] for k in range(n)))
+      f.write(f'<path d="{"".join(d)}"/>\n')
+    f.write('</g>\n')
+
+    if labels:
+      f.write(f'<g font-family="sans-serif" font-size="{coord(font_size)}" text-anchor="middle" '
+              f'dominant-baseline="central" fill="{line_color}">\n')
+      for centers, row, _ in grid_rows(width, height, hex_size):
+        f.write(''.join(f'<text x="{coord(x)}" y="{coord(y)}">{hex_label(col, row, labels)}</text>'
+                        for col, (x, y) in enumerate(centers.tolist())) + '\n')
+      f.write('</g>\n')
+    f.write('</svg>\n')
+
+def write_pdf(path, width, height, hex_size, line_color='black', line_width=2, labels=None, font_size=None):
+  """
+  Write the grid as a single page pdf, one point per pixel, same parameters
+  as write_svg with line_color anything PIL.ImageColor understands.
+
+  The page content is deflated as it is written and the pdf objects around
+  it are written by hand, so only one row of hexes is in memory at a time.
+  """
+  offsets = hex_vertex_offsets(hex_size)
+  red, green, blue = [c/255 for c in ImageColor.getrgb(line_color)[:3]]
+  font_size = font_size or hex_size/3
+  # Helvetica digits are 0.556 em wide, used to center the labels
+  digit_width = 0.556 * font_size
+
+  with open(path, 'wb') as f:
+    positions = {}
+
+    def start_object(obj):
+      positions[obj] = f.tell()
+      f.write(f'{obj} 0 obj\n'.encode())
+
+    f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    start_object(1)
+    f.write(b'<< /Type /Catalog /Pages 2 0 R >>\nendobj\n')
+    start_object(2)
+    f.write(b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>\nendobj\n')
+    start_object(3)
+    f.write(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] /Contents 4 0 R '
+            f'/Resources << /Font << /F1 6 0 R >> >> >>\nendobj\n'.encode())
+
+    # content stream, its length isn't known up front so it is object 5
+    start_object(4)
+    f.write(b'<< /Length 5 0 R /Filter /FlateDecode >>\nstream\n')
+    compressor = zlib.compressobj(6)
+    length = 0
+
+    def emit(text):
+      nonlocal length
+      data = compressor.compress(text.encode())
+      length += len(data)
+      f.write(data)
+
+    # flip y so the grid's pixel coordinates can be used as they are
+    emit(f'1 0 0 -1 0 {height} cm {coord(red)} {coord(green)} {coord(blue)} RG {line_width} w 1 j\n')
+    for centers, _, (hexes, start, runs) in grid_rows(width, height, hex_size):
+      ops = []
+      # every vertex a run can pass, a run of n edges uses the first n+1
+      corners = centers[hexes][:,None,:] + offsets[(start[:,None] + np.arange(7)) % 6]
+      for run, n in zip(corners.tolist(), runs.tolist()):
+        ops.append(f'{coord(run[0][0])} {coord(run[0][1])} m ' +
+                   ' '.join(f'{coord(x)} {coord(y)} l' for x, y in run[1:n+1]))
+      emit('\n'.join(ops) + '\nS\n')
+
+    if labels:
+      emit(f'{coord(red)} {coord(green)} {coord(blue)} rg\n')
+      for centers, row, _ in grid_rows(width, height, hex_size):
+        texts = []
+        for col, (x, y) in enumerate(centers.tolist()):
+          label = hex_label(col, row, labels)
+          # text is flipped back upright, its baseline a third of the size below the center
+          tx = x - digit_width*len(label)/2
+          texts.append(f'BT /F1 {coord(font_size)} Tf 1 0 0 -1 {coord(tx)} {coord(y + font_size/3)} Tm ({label}) Tj ET')
+        emit('\n'.join(texts) + '\n')
+
+    data = compressor.flush()
+    length += len(data)
+    f.write(data)
+    f.write(b'\nendstream\nendobj\n')
+    start_object(5)
+    f.write(f'{length}\nendobj\n'.encode())
+    start_object(6)
+    f.write(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>\nendobj\n')
+
+    xref = f.tell()
+    f.write(f'xref\n0 {len(positions) + 1}\n0000000000 65535 f \n'.encode())
+    for obj in sorted(positions):
+      f.write(f'{positions[obj]:010d} 00000 n \n'.encode())
+    f.write(f'trailer\n<< /Size {len(positions) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
@@ -1,63 +1,58 @@
-from PIL import Image, ImageDraw
-import math
+import sys
+import argparse
+
+from hex_grid import create_hexagon_grid, write_png_tiled, write_tiff_tiled, write_tile_pyramid, default_tile_size
+from hex_vector import write_svg, write_pdf
+
+# hexagonal grid overlay, e.g.
+#   python hexagonal-grid.py
+#   python hexagonal-grid.py 30000 20000 --size 40 --tile-size 512 -o battle-map.png
+#   python hexagonal-grid.py 30000 20000 --size 40 -o battle-map.tif
+#   python hexagonal-grid.py 30000 20000 --size 40 --pyramid -o battle-map-tiles
+#   python hexagonal-grid.py 3300 5100 --size 40 --labels grid -o hex-crawl.pdf
+# .svg and .pdf output is vector and prints sharp at any dpi. with --tile-size,
+# .tif output or --pyramid the grid is drawn tile by tile and streamed to
+# disk, so memory doesn't grow with the map
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Draw a transparent hexagonal grid overlay.')
+    parser.add_argument('width', type=int, nargs='?', default=450, help='image width in pixels (default: 450)')
+    parser.add_argument('height', type=int, nargs='?', default=450, help='image height in pixels (default: 450)')
+    parser.add_argument('--size', type=float, default=18, help='hexagon radius in pixels (default: 18)')
+    parser.add_argument('--line-color', default='black', help='grid line color (default: black)')
+    parser.add_argument('--line-width', type=int, default=2, help='grid line width (default: 2)')
+    parser.add_argument('-o', '--output', default='hexagon_grid.png',
+                        help='.png, .tif, .svg or .pdf path, or a directory with --pyramid (default: hexagon_grid.png)')
+    parser.add_argument('--tile-size', type=int,
+                        help=f'render tile by tile, implied by .tif and --pyramid (default there: {default_tile_size})')
+    parser.add_argument('--pyramid', action='store_true', help='write a z/x/y.png tile pyramid into the output directory')
+    parser.add_argument('--labels', choices=['grid', 'axial'],
+                        help='.svg and .pdf only, label hexes with column and row (0312) or axial q,r')
+    parser.add_argument('--font-size', type=float, help='label size (default: a third of --size)')
+    args = parser.parse_args(argv)
+
+    grid = (args.width, args.height, args.size, args.line_color, args.line_width)
+    tile_size = args.tile_size or default_tile_size
+    try:
+        if args.pyramid:
+            max_zoom = write_tile_pyramid(args.output, *grid, tile_size=tile_size)
+            print(f"Hexagon grid tiles saved in '{args.output}', zoom 0 to {max_zoom}")
+            return 0
+        vector = {'.svg': write_svg, '.pdf': write_pdf}.get(args.output.lower()[-4:])
+        if vector:
+            vector(args.output, *grid, labels=args.labels, font_size=args.font_size)
+        elif args.output.lower().endswith(('.tif', '.tiff')):
+            write_tiff_tiled(args.output, *grid, tile_size=tile_size)
+        elif args.tile_size:
+            write_png_tiled(args.output, *grid, tile_size=tile_size)
+        else:
+            create_hexagon_grid(*grid).save(args.output, 'png')
+    except (OSError, ValueError, ImportError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 2
+
+    print(f"Hexagon grid saved as '{args.output}'")
+    return 0
 
-def create_hexagon_grid(width, height, hex_size, line_color='black', line_width=2):
-    """
-    Create a hexagonal grid PNG image.
-
-    Parameters:
-    - width, height: Dimensions of the output image
-    - hex_size: Radius of the hexagon (distance from center to vertex)
-    - line_color: Color of the grid lines
-    - line_width: Width of the grid lines
-    - bg_color: Background color of the image
-    """
-
-    # Calculate hexagon properties
-    hex_width = hex_size * 2
-    hex_height = math.sqrt(3) * hex_size
-    horizontal_spacing = hex_size * math.sqrt(3)/2
-    vertical_spacing = hex_height* math.sqrt(3)
-
-    # Create blank image
-    img = Image.new('RGBA', (width, height), (0,0,0,0))
-    draw = ImageDraw.Draw(img)
-
-    # Draw hexagons in a grid pattern
-    for row in range(0, int(height // vertical_spacing) + 1):
-        for col in range(0, int(width // horizontal_spacing) + 1):
-            # Calculate center position
-            x = col * horizontal_spacing
-            y = row * vertical_spacing
-
-            # Offset every other column
-            if col % 2 == 1:
-                y += vertical_spacing / 2
-
-            # Generate hexagon vertices
-            vertices = []
-            for i in range(6):
-                angle_deg = 60 * i - 30
-                angle_rad = math.pi / 180 * angle_deg
-                vx = x + hex_size * math.cos(angle_rad)
-                vy = y + hex_size * math.sin(angle_rad)
-                vertices.append((vx, vy))
-
-            # Draw hexagon
-            draw.polygon(vertices, outline=line_color, width=line_width)
-
-    return img
-
-# Example usage
 if __name__ == "__main__":
-    # Parameters
-    image_width = 450
-    image_height = 450
-    hex_radius = 18  # Size of each hexagon
-
-    # Create the grid
-    hex_grid = create_hexagon_grid(image_width, image_height, hex_radius)
-
-    # Save to file
-    hex_grid.save('hexagon_grid.png', 'png')
-    print("Hexagon grid saved as 'hexagon_grid.png'")
+    sys.exit(main())
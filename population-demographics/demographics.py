@@ -0,0 +1,400 @@
+#!/usr/bin/python3
+
+from collections import namedtuple
+
+import numpy as np
+from scipy.stats import skewnorm
+
+from population_data import load_population_data, validate_population_data
+
+
+# population demographics engine shared by rand-population-demographics.py and
+# random-population-demographics-gui.py, kept free of Qt and matplotlib so it
+# imports fast in scripts and worker processes. Randomness always comes from an
+# explicit numpy Generator, seed or SeedSequence, never the global np.random state;
+# generate_settlements gives every block of settlement ids its own child stream so
+# any range of a world comes out the same no matter which process generates it.
+# Population data files are read, validated and cached by population_data.
+# Every step runs on arrays over all settlements at once:
+#  - tier counts are poisson(0.25+2*chance) draws capped at the number of
+#    ancestries with non-zero odds, redrawn until at least one ancestry appears
+#  - ancestries are picked without replacement by odds with Efraimidis-Spirakis
+#    keys, the same distribution as np.random.choice(replace=False, p=odds), from
+#    a PopulationSampler compiled once per population data and reused until it changes
+#  - the skewnorm draws order the picked ancestries from biggest to smallest
+#  - the percentages are split off the remaining 100% with triangular draws and
+#    the leftover goes to 'other', exactly as the script does it per settlement
+
+default_chances = {'Common': 0.7, 'Uncommon': 0.25, 'Rare': 0.05}
+
+# scale of the skewnorm draws that order the picked ancestries
+default_skew_width = 0.20
+
+# records holds one row per (settlement, ancestry) with 'other' as the last rank,
+# ancestry indexes into names and tier_counts is the number of ancestries per tier
+DemographicsBatch = namedtuple('DemographicsBatch', ['records', 'tier_counts', 'names', 'tiers'])
+
+# a single settlement, tier_counts is a dict of tier -> number of ancestries and
+# shares a list of (percent, ancestry) from biggest to smallest ending with 'other'
+Demographics = namedtuple('Demographics', ['tier_counts', 'shares'])
+
+def tier_arrays(data, tiers):
+  """
+  Ancestry names and odds as arrays for each tier of a population-data dict.
+  """
+  names = [np.array(list(data.get(tier, {}).keys()), dtype='str') for tier in tiers]
+  odds = [np.array(list(data.get(tier, {}).values()), dtype='float') for tier in tiers]
+  return names, odds
+
+def data_signature(data, tiers):
+  """
+  Hashable snapshot of the tiers of a population-data dict, changes whenever
+  an ancestry is added, removed, renamed or has its odds edited.
+  """
+  return tuple((tier, tuple(data.get(tier, {}).items())) for tier in tiers)
+
+def skew_scale(chance):
+  # convert x_chance to a y_scale for skewnorm
+  # y_scale = -27.2343 * tan( 1.4076 * (x_chance - 0.5) )
+  return np.around(27.2343*np.tan(-1.4076*(chance-0.5)))
+
+class PopulationSampler:
+  """
+  Population data compiled once for repeated sampling.
+
+  Holds the names, cumulative odds and reciprocal odds of every tier as
+  arrays, so no draw has to renormalize the odds again. Call refresh(data)
+  before sampling from data that may have been edited, it only recompiles
+  when data_signature changed.
+  """
+
+  def __init__(self, data, tiers):
+    self.tiers = list(tiers)
+    self.signature = None
+    self.refresh(data)
+
+  def refresh(self, data):
+    signature = data_signature(data, self.tiers)
+    if signature == self.signature:
+      return self
+
+    self.signature = signature
+    self.tier_names, self.tier_odds = tier_arrays(data, self.tiers)
+    self.cumulative = [np.cumsum(odds) for odds in self.tier_odds]
+    # log(u)/odds as log(u)*inv_odds, zero odds get inf so their keys are -inf
+    with np.errstate(divide='ignore'):
+      self.inv_odds = [np.where(odds > 0, 1/odds, np.inf) for odds in self.tier_odds]
+    self.nmax = np.array([np.count_nonzero(odds) for odds in self.tier_odds])
+    self.offsets = np.cumsum([0] + [np.size(names) for names in self.tier_names])
+    self.names = np.concatenate(self.tier_names + [np.array(['other'])])
+    return self
+
+  def sample(self, rng, tier, num_settlements, size):
+    """
+    Weighted sample of size ancestries without replacement from a tier for
+    each settlement, in the order successive weighted draws would pick them.
+
+    Small samples from big tiers draw with replacement off the cumulative odds
+    and redraw repeats, which conditions each draw on the ones before it. Rows
+    still repeating after rejection_rounds, and samples taking most of the tier,
+    finish with Efraimidis-Spirakis keys u**(1/odds) over what is left.
+
+    Returns indices into the tier of shape (num_settlements, size).
+    """
+    out = np.zeros((num_settlements, size), dtype='int64')
+    if 2*size > self.nmax[tier]:
+      return self.sample_keys(rng, tier, out, np.arange(num_settlements), 0)
+
+    cumulative = self.cumulative[tier]
+    for j in range(size):
+      rows = np.arange(num_settlements)
+      for i in range(rejection_rounds):
+        draw = np.searchsorted(cumulative, cumulative[-1]*rng.random(np.size(rows)), side='right')
+        repeat = (out[rows,:j] == draw[:,None]).any(axis=1)
+        out[rows[~repeat], j] = draw[~repeat]
+        rows = rows[repeat]
+        if np.size(rows) == 0:
+          break
+      else:
+        out = self.sample_keys(rng, tier, out, rows, j)
+    return out
+
+  def sample_keys(self, rng, tier, out, rows, start):
+    # fill out[rows, start:] with Efraimidis-Spirakis keys, skipping out[rows, :start]
+    size = out.shape[1] - start
+    inv_odds = self.inv_odds[tier]
+    u = rng.random((np.size(rows), np.size(inv_odds)))
+    with np.errstate(divide='ignore'):
+      keys = np.log(u) * inv_odds
+    keys[np.arange(np.size(rows))[:,None], out[rows,:start]] = -np.inf
+    if size < np.size(inv_odds):
+      # only the top size keys matter, partition first and sort just those
+      top = np.argpartition(-keys, size-1, axis=1)[:,:size]
+      order = np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1, kind='stable')
+      out[rows, start:] = np.take_along_axis(top, order, axis=1)
+    else:
+      out[rows, start:] = np.argsort(-keys, axis=1, kind='stable')[:,:size]
+    return out
+
+# redraws of a repeated ancestry before PopulationSampler.sample switches to keys
+rejection_rounds = 4
+
+# compiled samplers of recently used population data, by tiers and data_signature
+sampler_cache_size = 8
+sampler_cache = {}
+
+def compile_population_data(data, tiers):
+  """
+  PopulationSampler for data, reused across calls until the data changes.
+  """
+  tiers = list(tiers)
+  signature = data_signature(data, tiers)
+  # key on the hash so the (possibly long) signature is only hashed once per call
+  key = hash((tuple(tiers), signature))
+  sampler = sampler_cache.pop(key, None)
+  if sampler is None or sampler.tiers != tiers or sampler.signature != signature:
+    sampler = PopulationSampler(data, tiers)
+  sampler_cache[key] = sampler
+  while len(sampler_cache) > sampler_cache_size:
+    del sampler_cache[next(iter(sampler_cache))]
+  return sampler
+
+def draw_tier_counts(rng, chances, nmax, num_settlements):
+  """
+  Poisson count per tier capped at nmax, rows with no ancestries are redrawn.
+  """
+  lam = 0.25 + 2*np.asarray(chances)
+  counts = np.minimum(rng.poisson(lam, (num_settlements, np.size(lam))), nmax)
+  empty = counts.sum(axis=1) < 1
+  while empty.any():
+    counts[empty] = np.minimum(rng.poisson(lam, (np.count_nonzero(empty), np.size(lam))), nmax)
+    empty = counts.sum(axis=1) < 1
+  return counts
+
+def split_percentages(rng, maxiterations, nmax_total, vastmajority=False, scale=1):
+  """
+  Percentages (times scale) for each settlement, same steps as the script.
+
+  Returns (popdemo, nshares): an int array of shape (num_settlements,
+  max(maxiterations)+1) where row i holds nshares[i] shares in decreasing
+  order followed by 'other', past that its values are meaningless. nshares is
+  maxiterations, except for rows whose remainder ran out before all their
+  ancestries got a share and had more than the other cap left, which keep the
+  shares drawn so far as in the script. Settlements with a single ancestry get
+  99% and 1% other.
+  """
+  num_settlements = np.size(maxiterations)
+  rows = np.arange(num_settlements)
+  width = max(int(np.max(maxiterations)), 1) + 1
+  # positions past a row's current length hold a sentinel so sorts push them to the end
+  sentinel = np.iinfo('int64').min
+  popdemo = np.full((num_settlements, width), sentinel, dtype='int64')
+
+  multi = maxiterations > 1
+  tol = 2 * scale # tolerance, when remainder is less than end simulation
+  remainder = np.full(num_settlements, 100 * scale, dtype='int64')
+
+  if(vastmajority):
+    first = (scale * rng.triangular(61, 75, 90, num_settlements)).astype('int64')
+  else:
+    first = (scale * rng.triangular(1, 25, 50, num_settlements)).astype('int64')
+  popdemo[:,0] = first
+  remainder -= first
+  iterations = np.ones(num_settlements, dtype='int64')
+
+  for step in range(1, width-1):
+    active = multi & (remainder >= tol) & (iterations < maxiterations)
+    if not active.any():
+      break
+    # inactive rows get a harmless dummy triangle and are discarded
+    draw = rng.triangular(np.where(active, scale, 0), np.where(active, remainder//2, 0), np.where(active, remainder, 1))
+    rng_val = draw.astype('int64')
+    popdemo[active, step] = rng_val[active]
+    remainder[active] -= rng_val[active]
+    iterations[active] += 1
+
+  popdemo = np.sort(popdemo, axis=1)[:,::-1]
+
+  other_cap = np.minimum(nmax_total//3, rng.integers(7, 15, num_settlements)) * scale
+  other_diff = remainder - other_cap
+
+  # not enough shares drawn, split extra ones off the current biggest share
+  short = multi & (other_diff <= 0) & (iterations < maxiterations)
+  diff = np.where(short, maxiterations - iterations, 0)
+  for i in range(int(diff.max(initial=0))):
+    active = short & (i < diff)
+    idx = np.argmax(popdemo, axis=1)
+    shift = rng.integers(1, np.where(active, scale*(diff-i)+1, 2))
+    popdemo[rows[active], idx[active]] -= shift[active]
+    popdemo[rows[active], (iterations+i)[active]] = shift[active]
+  popdemo[short] = np.sort(popdemo[short], axis=1)[:,::-1]
+
+  # too much left over, hand what's over the other cap to the two biggest shares
+  spill = multi & (other_diff > 0)
+  popdiff1 = rng.integers(0, np.where(spill, other_diff+1, 1))
+  popdiff2 = other_diff - popdiff1
+  popdemo[spill,0] += np.maximum(popdiff1, popdiff2)[spill]
+  popdemo[spill,1] += np.minimum(popdiff1, popdiff2)[spill]
+
+  nshares = np.where(multi, np.where(spill, iterations, maxiterations), 1)
+  popdemo[rows[multi], nshares[multi]] = np.where(spill, other_cap, remainder)[multi]
+  popdemo[~multi,0] = 99 * scale
+  popdemo[~multi,1] = 1 * scale
+  return popdemo, nshares
+
+def generate_demographics_batch(data, num_settlements, chances=None, vastmajority=False, ndecimals=0, rng=None,
+                                skew_width=None):
+  """
+  Generate ancestry breakdowns for many settlements in one call.
+
+  Parameters:
+  - data: population data dict of tier -> {ancestry: odds}, as in population-data-*.json,
+    or a PopulationSampler compiled for the tiers in chances
+  - num_settlements: number of breakdowns to generate
+  - chances: dict of tier -> chance, defaults to default_chances
+  - vastmajority: the biggest ancestry takes 61-90% instead of 1-50%
+  - ndecimals: decimal places of the percentages
+  - rng: numpy Generator, or a seed or SeedSequence to start one from, unseeded by default
+  - skew_width: scale of the skewnorm draws, defaults to default_skew_width
+
+  Returns a DemographicsBatch.
+  """
+  rng = np.random.default_rng(rng)
+  chances = chances if chances is not None else default_chances
+  skew_width = skew_width if skew_width is not None else default_skew_width
+  tiers = list(chances.keys())
+  if isinstance(data, PopulationSampler):
+    sampler = data
+    if sampler.tiers != tiers:
+      raise ValueError(f'Sampler was compiled for tiers {sampler.tiers}, not {tiers}')
+  else:
+    sampler = compile_population_data(data, tiers)
+  chance_arr = np.array([chances[tier] for tier in tiers])
+
+  scale = 10**ndecimals if ndecimals > 0 else 1
+
+  nmax = sampler.nmax
+  if nmax.sum() < 1:
+    raise ValueError('Population data needs at least one ancestry with non-zero odds')
+  counts = draw_tier_counts(rng, chance_arr, nmax, num_settlements)
+  maxiterations = counts.sum(axis=1)
+
+  # pick ancestries per tier and give each its skewnorm draw, unused slots get -inf
+  picked = []
+  dist = []
+  for t, tier in enumerate(tiers):
+    width = int(counts[:,t].max())
+    if width == 0:
+      continue
+    order = sampler.sample(rng, t, num_settlements, width)
+    tier_dist = skewnorm.rvs(skew_scale(chance_arr[t]), loc=chance_arr[t], scale=skew_width,
+                             size=(num_settlements, width), random_state=rng)
+    used = np.arange(width)[None,:] < counts[:,t,None]
+    picked.append(order + sampler.offsets[t])
+    dist.append(np.where(used, tier_dist, -np.inf))
+  picked = np.concatenate(picked, axis=1)
+  dist = np.concatenate(dist, axis=1)
+
+  sort_idx = np.argsort(-dist, axis=1, kind='stable')
+  choice = np.take_along_axis(picked, sort_idx, axis=1)
+
+  popdemo, nshares = split_percentages(rng, maxiterations, int(nmax.sum()), vastmajority, scale)
+
+  names = sampler.names
+  other = np.size(names)-1
+  width = popdemo.shape[1]
+  ancestry = np.full((num_settlements, width), other)
+  ancestry[:,:min(width, choice.shape[1])] = choice[:,:width]
+  rank = np.arange(width)[None,:]
+  ancestry[rank == nshares[:,None]] = other
+  keep = rank <= nshares[:,None]
+
+  if ndecimals > 0:
+    percent = np.round(popdemo / scale, ndecimals)
+  else:
+    percent = popdemo
+
+  records = np.zeros(np.count_nonzero(keep), dtype=[('settlement', 'int64'), ('rank', 'int32'),
+                                                    ('ancestry', 'int32'), ('percent', percent.dtype)])
+  records['settlement'] = np.broadcast_to(np.arange(num_settlements)[:,None], keep.shape)[keep]
+  records['rank'] = np.broadcast_to(rank, keep.shape)[keep]
+  records['ancestry'] = ancestry[keep]
+  records['percent'] = percent[keep]
+
+  return DemographicsBatch(records, counts, names, tiers)
+
+def batch_to_dataframe(batch):
+  """
+  DemographicsBatch records as a pandas DataFrame with ancestry names.
+  """
+  import pandas as pd
+  df = pd.DataFrame(batch.records)
+  df['ancestry'] = batch.names[batch.records['ancestry']]
+  return df
+
+def generate_demographics(data, chances=None, vastmajority=False, ndecimals=0, rng=None):
+  """
+  Generate one ancestry breakdown, same parameters as generate_demographics_batch.
+
+  Returns a Demographics.
+  """
+  batch = generate_demographics_batch(data, 1, chances, vastmajority, ndecimals, rng)
+  tier_counts = dict(zip(batch.tiers, batch.tier_counts[0].tolist()))
+  shares = [(percent, str(batch.names[ancestry])) for percent, ancestry in zip(batch.records['percent'].tolist(), batch.records['ancestry'])]
+  return Demographics(tier_counts, shares)
+
+def format_shares(shares, ndecimals=0):
+  """
+  One '<percent>%: <ancestry>' line per share, percentages right aligned.
+  """
+  width = 3+ndecimals if ndecimals > 0 else 2
+  if ndecimals > 0:
+    return [f'{val:{width}.{ndecimals}f}' + '%: ' + anc for val, anc in shares]
+  return [f'{val:{width}}' + '%: ' + anc for val, anc in shares]
+
+# settlements per child stream of generate_settlements, part of the output so
+# changing it changes every seeded world
+stream_block_size = 1024
+
+def block_seed(seed, block):
+  """
+  SeedSequence of one block of settlements, the same child seed.spawn would
+  give as its block-th child but without spawning every child before it.
+  """
+  return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (block,), pool_size=seed.pool_size)
+
+def generate_settlements(data, start, stop, seed, chances=None, vastmajority=False, ndecimals=0):
+  """
+  Generate settlements start..stop-1 of the world given by seed.
+
+  Settlement i is drawn from the child stream of block i // stream_block_size,
+  so splitting a world into ranges across processes, in any order, gives the
+  same records as generating it in one call. Blocks cut by start or stop are
+  generated whole and trimmed.
+
+  Parameters:
+  - seed: int or SeedSequence of the whole world, None for fresh entropy
+  - the rest as generate_demographics_batch
+
+  Returns a DemographicsBatch with records['settlement'] holding the settlement ids
+  and tier_counts one row per settlement from start.
+  """
+  seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+  chances = chances if chances is not None else default_chances
+  sampler = compile_population_data(data, chances.keys()) if not isinstance(data, PopulationSampler) else data
+
+  records = []
+  tier_counts = []
+  for block in range(start // stream_block_size, -(-stop // stream_block_size)):
+    first = block * stream_block_size
+    rng = np.random.default_rng(block_seed(seed, block))
+    batch = generate_demographics_batch(sampler, stream_block_size, chances, vastmajority, ndecimals, rng)
+    lo, hi = max(start, first) - first, min(stop, first + stream_block_size) - first
+    block_records = batch.records[(batch.records['settlement'] >= lo) & (batch.records['settlement'] < hi)]
+    block_records['settlement'] += first
+    records.append(block_records)
+    tier_counts.append(batch.tier_counts[lo:hi])
+
+  if not records:
+    return generate_demographics_batch(sampler, 0, chances, vastmajority, ndecimals, seed)
+  return DemographicsBatch(np.concatenate(records), np.concatenate(tier_counts), sampler.names, list(chances.keys()))
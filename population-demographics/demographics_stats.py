@@ -0,0 +1,228 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import poisson
+
+from demographics import (default_chances, default_skew_width, load_population_data, compile_population_data,
+                          generate_demographics_batch, block_seed)
+
+
+# distribution of what the demographics engine generates, for tuning the tier
+# chances and the skewnorm width without eyeballing single settlements, e.g.
+#   ./demographics_stats.py -d population-data-dnd5e.json -n 4000000 --chances Common=0.6,Uncommon=0.3,Rare=0.1
+#
+# the number of ancestries per tier and in total is exact: each tier is a
+# poisson count capped at its ancestries with non-zero odds, redrawn while all
+# tiers are empty, so it's a product of capped poissons conditioned on a
+# non-empty total. the shares and top slots go through the percentage split and
+# are estimated from chunks of settlements run through the batch engine, each
+# chunk only adding to running sums, so any number of settlements runs in flat
+# memory, optionally over a process pool. chunk i always draws from child i of
+# the seed, so the estimate doesn't depend on the number of workers.
+
+# settlements per chunk of the simulation
+stats_chunk_size = 64*1024
+
+# exact counts and simulated shares, arrays over names are indexed like the
+# DemographicsBatch names with 'other' last, tier_count_pmf[t][k] is the chance
+# of k ancestries from tiers[t] and count_pmf[k] of k ancestries overall
+DemographicsStats = namedtuple('DemographicsStats', ['num_settlements', 'names', 'tiers', 'ancestry_tier',
+                                                     'count_pmf', 'tier_count_pmf', 'count_freq',
+                                                     'mean_share', 'share_stderr', 'present', 'top'])
+
+def capped_poisson_pmf(lam, nmax):
+  """
+  pmf of min(poisson(lam), nmax) over 0..nmax.
+  """
+  pmf = poisson.pmf(np.arange(nmax+1), lam)
+  pmf[nmax] = poisson.sf(nmax-1, lam)
+  return pmf
+
+def tier_count_distribution(chances, nmax):
+  """
+  Exact distribution of the ancestry counts of draw_tier_counts.
+
+  Returns (tier_pmfs, total_pmf), one pmf over 0..nmax[t] per tier and the
+  pmf of their sum over 0..sum(nmax), all conditioned on a non-empty total.
+  """
+  lam = 0.25 + 2*np.asarray(chances, dtype='float')
+  raw = [capped_poisson_pmf(l, int(n)) for l, n in zip(lam, nmax)]
+  empty = np.prod([pmf[0] for pmf in raw])
+  if empty >= 1:
+    raise ValueError('Population data needs at least one ancestry with non-zero odds')
+
+  total = np.ones(1)
+  for pmf in raw:
+    total = np.convolve(total, pmf)
+  total[0] = 0
+  total /= 1 - empty
+
+  tier_pmfs = []
+  for t, pmf in enumerate(raw):
+    # a tier drawing none only survives the redraw when another tier drew some
+    others_empty = empty / pmf[0] if pmf[0] > 0 else 0
+    conditioned = pmf.copy()
+    conditioned[0] *= 1 - others_empty
+    tier_pmfs.append(conditioned / (1 - empty))
+  return tier_pmfs, total
+
+# filled in by init_worker in each worker process
+worker_settings = None
+
+def init_worker(settings):
+  global worker_settings
+  worker_settings = settings
+  compile_population_data(settings['data'], settings['chances'].keys())
+
+def run_chunk(chunk):
+  """
+  Running sums of one chunk of stats_chunk_size settlements, or fewer for the last one.
+  """
+  index, size = chunk
+  s = worker_settings
+  rng = np.random.default_rng(block_seed(s['seed'], index))
+  batch = generate_demographics_batch(s['data'], size, s['chances'], s['vastmajority'], s['ndecimals'], rng,
+                                      s['skew_width'])
+
+  records = batch.records
+  nnames = np.size(batch.names)
+  percent = records['percent'].astype('float')
+  top = records['rank'] == 0
+  return {'counts': np.bincount(batch.tier_counts.sum(axis=1), minlength=s['nmax_total']+1),
+          'share': np.bincount(records['ancestry'], weights=percent, minlength=nnames),
+          'share_sq': np.bincount(records['ancestry'], weights=percent**2, minlength=nnames),
+          'present': np.bincount(records['ancestry'], minlength=nnames),
+          'top': np.bincount(records['ancestry'][top], minlength=nnames)}
+
+def chunks(num_settlements, chunk_size=stats_chunk_size):
+  for index, start in enumerate(range(0, num_settlements, chunk_size)):
+    yield index, min(chunk_size, num_settlements - start)
+
+def demographics_stats(data, num_settlements, chances=None, vastmajority=False, ndecimals=0, seed=None,
+                       skew_width=None, workers=1):
+  """
+  Distribution of the ancestry breakdowns generate_demographics_batch gives.
+
+  Parameters:
+  - data: population data dict of tier -> {ancestry: odds}
+  - num_settlements: settlements to simulate for the shares and top slots
+  - chances, vastmajority, ndecimals, skew_width: as in generate_demographics_batch
+  - seed: int or SeedSequence, None for fresh entropy
+  - workers: worker processes, 1 runs in this process, None one per core
+
+  Returns a DemographicsStats where count_freq, mean_share, present and top are
+  simulated and the rest exact. mean_share is the average percent an ancestry
+  gets over all settlements, zero where it doesn't appear, with share_stderr
+  its standard error. present and top are the fraction of settlements an
+  ancestry appears in and is the biggest share of.
+  """
+  chances = chances if chances is not None else default_chances
+  seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+  tiers = list(chances.keys())
+  sampler = compile_population_data(data, tiers)
+  tier_count_pmf, count_pmf = tier_count_distribution([chances[tier] for tier in tiers], sampler.nmax)
+
+  settings = {
+    'data': data,
+    'chances': chances,
+    'vastmajority': vastmajority,
+    'ndecimals': ndecimals,
+    'skew_width': skew_width,
+    'seed': seed,
+    'nmax_total': int(sampler.nmax.sum()),
+  }
+  nnames = np.size(sampler.names)
+  totals = {'counts': np.zeros(settings['nmax_total']+1), 'share': np.zeros(nnames), 'share_sq': np.zeros(nnames),
+            'present': np.zeros(nnames), 'top': np.zeros(nnames)}
+
+  def add(sums):
+    for key, value in sums.items():
+      totals[key] += value
+
+  if workers == 1:
+    init_worker(settings)
+    for chunk in chunks(num_settlements):
+      add(run_chunk(chunk))
+  else:
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(settings,)) as executor:
+      for sums in executor.map(run_chunk, chunks(num_settlements)):
+        add(sums)
+
+  n = max(num_settlements, 1)
+  mean_share = totals['share'] / n
+  variance = np.maximum(totals['share_sq'] / n - mean_share**2, 0)
+  ancestry_tier = np.searchsorted(sampler.offsets, np.arange(nnames), side='right') - 1
+  return DemographicsStats(num_settlements, sampler.names, tiers, ancestry_tier, count_pmf, tier_count_pmf,
+                           totals['counts'] / n, mean_share, np.sqrt(variance / n), totals['present'] / n,
+                           totals['top'] / n)
+
+def format_stats(stats, limit=None):
+  """
+  Lines of a plain text report of a DemographicsStats.
+  """
+  lines = [f'{stats.num_settlements} settlements simulated', '', 'ancestries  exact %  simulated %']
+  for k, p in enumerate(stats.count_pmf):
+    # skip the counts too rare to show up at this precision
+    if p >= 5e-6 or stats.count_freq[k] > 0:
+      lines.append(f'{k:10d}  {100*p:7.3f}  {100*stats.count_freq[k]:11.3f}')
+
+  lines += ['', 'tier       expected ancestries']
+  for tier, pmf in zip(stats.tiers, stats.tier_count_pmf):
+    lines.append(f'{tier:10s} {np.dot(np.arange(np.size(pmf)), pmf):.3f}')
+
+  tier_names = stats.tiers + ['']
+  order = np.argsort(-stats.mean_share, kind='stable')[:limit]
+  width = max(len(str(name)) for name in stats.names)
+  lines += ['', f'{"ancestry":{width}s}  {"tier":10s}  mean %  +/-     present %  top %']
+  for i in order:
+    lines.append(f'{stats.names[i]:{width}s}  {tier_names[stats.ancestry_tier[i]]:10s}  {stats.mean_share[i]:6.2f}  '
+                 f'{stats.share_stderr[i]:6.3f}  {100*stats.present[i]:9.2f}  {100*stats.top[i]:5.2f}')
+  return lines
+
+def parse_chances(text):
+  """
+  'Common=0.7,Uncommon=0.25,Rare=0.05' into a dict of tier -> chance.
+  """
+  chances = {}
+  for item in text.split(','):
+    name, sep, value = item.partition('=')
+    if not sep:
+      raise argparse.ArgumentTypeError(f'Expected tier=chance, got {item!r}')
+    chances[name.strip()] = float(value)
+  return chances
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Distribution of the ancestry breakdowns the demographics engine generates.')
+  parser.add_argument('-n', '--settlements', type=int, default=1000000, help='settlements to simulate (default: 1000000)')
+  parser.add_argument('-d', '--data', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'population-data-dnd5e.json'),
+                      help='population data json (default: population-data-dnd5e.json)')
+  parser.add_argument('--chances', type=parse_chances, help='tier chances, e.g. Common=0.7,Uncommon=0.25,Rare=0.05')
+  parser.add_argument('--skew-width', type=float, default=default_skew_width,
+                      help=f'scale of the skewnorm draws (default: {default_skew_width})')
+  parser.add_argument('--vast-majority', action='store_true', help='the biggest ancestry takes 61-90%%')
+  parser.add_argument('--decimals', type=int, default=0, help='decimal places of the percentages (default: 0)')
+  parser.add_argument('--seed', type=int, help='seed of the simulation')
+  parser.add_argument('--workers', type=int, default=1, help='worker processes, 0 for one per core (default: 1)')
+  parser.add_argument('--limit', type=int, help='only list the ancestries with the biggest mean shares')
+  args = parser.parse_args(argv)
+
+  try:
+    data = load_population_data(args.data)
+    stats = demographics_stats(data, args.settlements, args.chances, args.vast_majority, args.decimals, args.seed,
+                               args.skew_width, args.workers or None)
+  except (OSError, ValueError) as e:
+    print(f'Error: {e}', file=sys.stderr)
+    return 2
+
+  print('\n'.join(format_stats(stats, args.limit)))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+
+import os
+import json
+import math
+import hashlib
+import tempfile
+import numbers
+
+import numpy as np
+
+
+# loading and validation of population-data-*.json files, tier -> {ancestry: odds}
+# with odds a finite number >= 0. a validated file is compiled to a compact .npz
+# (the ancestry names interned once, one float array of odds per tier) keyed by
+# the source's mtime, size and sha1, so later runs and worker processes skip the
+# json parsing and validation. an edited file whose bytes are unchanged (e.g. a
+# fresh checkout) is recognized by its hash and only has its key refreshed.
+# set POPULATION_CACHE_DIR (or pass cache_dir) to turn on the disk cache
+
+# bump when the validation rules or file layout change to orphan old files
+cache_version = 1
+memory_cache_size = 32
+
+# compiled files of this process by (path, mtime_ns, size, cache_dir)
+memory_cache = {}
+
+def validate_population_data(data, source='population data'):
+  """
+  Check data is a dict of tier -> {ancestry: odds}, raise ValueError naming
+  the first bad entry otherwise. Returns data.
+  """
+  if not isinstance(data, dict):
+    raise ValueError(f'{source}: expected an object of tier -> {{ancestry: odds}}, got {type(data).__name__}')
+  for tier, ancestries in data.items():
+    if not isinstance(tier, str) or not tier:
+      raise ValueError(f'{source}: tier names must be non-empty strings, got {tier!r}')
+    if not isinstance(ancestries, dict):
+      raise ValueError(f'{source}: {tier} must be an object of ancestry -> odds, got {type(ancestries).__name__}')
+    for ancestry, odds in ancestries.items():
+      if not isinstance(ancestry, str) or not ancestry.strip():
+        raise ValueError(f'{source}: {tier} has an ancestry without a name')
+      if isinstance(odds, bool) or not isinstance(odds, numbers.Real):
+        raise ValueError(f'{source}: odds of {ancestry} in {tier} must be a number, got {odds!r}')
+      if not math.isfinite(odds) or odds < 0:
+        raise ValueError(f'{source}: odds of {ancestry} in {tier} must be finite and >= 0, got {odds!r}')
+  return data
+
+def compile_population_arrays(data):
+  """
+  Validated population data as compact arrays: tiers, the unique ancestry
+  names, and per (tier, ancestry) entry its index into names and its odds,
+  tier t covering entries offsets[t]:offsets[t+1].
+  """
+  tiers = list(data.keys())
+  interned = {}
+  ancestry = []
+  odds = []
+  offsets = [0]
+  for tier in tiers:
+    for name, odd in data[tier].items():
+      ancestry.append(interned.setdefault(name, len(interned)))
+      odds.append(odd)
+    offsets.append(len(ancestry))
+  return {'tiers': np.array(tiers, dtype='str'),
+          'names': np.array(list(interned), dtype='str'),
+          'ancestry': np.array(ancestry, dtype='int32'),
+          'odds': np.array(odds, dtype='float'),
+          'offsets': np.array(offsets, dtype='int64')}
+
+def population_data_from_arrays(arrays):
+  """
+  Inverse of compile_population_arrays, whole odds come back as ints so the
+  dict saves to the same json it was read from.
+  """
+  names = arrays['names'].tolist()
+  ancestry = arrays['ancestry'].tolist()
+  odds = [int(odd) if odd.is_integer() else odd for odd in arrays['odds'].tolist()]
+  offsets = arrays['offsets'].tolist()
+  return {tier: {names[ancestry[i]]: odds[i] for i in range(offsets[t], offsets[t+1])}
+          for t, tier in enumerate(arrays['tiers'].tolist())}
+
+def population_cache_path(cache_dir, filepath):
+  """
+  File the disk cache uses for a source file, one per absolute path.
+  """
+  digest = hashlib.sha1(f'{cache_version}|{os.path.abspath(filepath)}'.encode()).hexdigest()[:20]
+  return os.path.join(cache_dir, f'popdata-{digest}.npz')
+
+def read_cached_arrays(path):
+  try:
+    with np.load(path) as cached:
+      if int(cached['version']) != cache_version:
+        return None
+      return {key: cached[key] for key in cached.files}
+  except (OSError, KeyError, ValueError):
+    # missing, half written or foreign file, just recompile it
+    return None
+
+def write_cached_arrays(path, arrays):
+  # write to a temp file and rename so parallel runs never see a partial file
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npz')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      np.savez(f, version=cache_version, **arrays)
+    os.replace(tmp_path, path)
+  except OSError:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+
+def load_population_arrays(filepath, cache_dir):
+  stat = os.stat(filepath)
+  path = population_cache_path(cache_dir, filepath) if cache_dir else None
+  cached = read_cached_arrays(path) if path and os.path.exists(path) else None
+  if cached is not None and int(cached['mtime_ns']) == stat.st_mtime_ns and int(cached['size']) == stat.st_size:
+    return cached
+
+  with open(filepath, 'rb') as f:
+    raw = f.read()
+  sha1 = hashlib.sha1(raw).hexdigest()
+  if cached is not None and str(cached['sha1']) == sha1:
+    arrays = {key: cached[key] for key in ('tiers', 'names', 'ancestry', 'odds', 'offsets')}
+  else:
+    try:
+      data = json.loads(raw)
+    except ValueError as e:
+      raise ValueError(f'{filepath}: not valid json, {e}') from None
+    arrays = compile_population_arrays(validate_population_data(data, filepath))
+
+  arrays.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size, sha1=sha1)
+  if path:
+    write_cached_arrays(path, arrays)
+  return arrays
+
+def load_population_data(filepath, cache_dir=None):
+  """
+  Read and validate a population-data-*.json file of tier -> {ancestry: odds}.
+
+  Parameters:
+  - filepath: population data json
+  - cache_dir: directory for the compiled .npz cache, defaults to
+    $POPULATION_CACHE_DIR, the disk cache is skipped when neither is set
+
+  Returns a new dict on every call, so callers are free to edit it. Raises
+  ValueError for files that are not valid population data.
+  """
+  if cache_dir is None:
+    cache_dir = os.environ.get('POPULATION_CACHE_DIR')
+  stat = os.stat(filepath)
+  key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size, cache_dir)
+  arrays = memory_cache.pop(key, None)
+  if arrays is None:
+    arrays = load_population_arrays(filepath, cache_dir)
+  memory_cache[key] = arrays
+  while len(memory_cache) > memory_cache_size:
+    del memory_cache[next(iter(memory_cache))]
+  return population_data_from_arrays(arrays)
+
+def clear_population_cache(cache_dir=None):
+  """
+  Empty the in-memory cache and, if given, delete the .npz files in cache_dir.
+  """
+  memory_cache.clear()
+  if cache_dir and os.path.isdir(cache_dir):
+    for name in os.listdir(cache_dir):
+      if name.startswith('popdata-') and name.endswith('.npz'):
+        os.remove(os.path.join(cache_dir, name))
@@ -2,17 +2,21 @@
 
 import numpy as np
 
-#vast_majority = np.random.randint(0,2)
+# set to an int to get the same percentages every run
+seed = None
+rng = np.random.default_rng(seed)
+
+#vast_majority = rng.integers(0,2)
 vast_majority = False
 #vast_majority = True
 
-npercent = np.random.randint(1,9)
+npercent = rng.integers(1,9)
 #npercent = 4
 ndecimals = 0
-other_max = np.random.randint(8,16)
-#percent = np.random.randint(1,101, npercent+1)
-modes = np.random.randint(1,101, npercent+1)
-percent = np.around(np.random.triangular(1, modes, 100, npercent+1))
+other_max = rng.integers(8,16)
+#percent = rng.integers(1,101, npercent+1)
+modes = rng.integers(1,101, npercent+1)
+percent = np.around(rng.triangular(1, modes, 100, npercent+1))
 
 if vast_majority:
   max_idx = np.argmax(percent)
@@ -22,7 +26,7 @@ percent = percent / np.sum(percent)
 percent = np.around(percent[np.argsort(percent)[::-1]]*100, ndecimals)
 sum_diff = 100 - np.sum(percent)
 percent[0] += sum_diff
-if percent[-2] < other_max and np.random.randint(0,2) == 1:
+if percent[-2] < other_max and rng.integers(0,2) == 1:
   percent[-2], percent[-1] = percent[-1], percent[-2]
 if percent[-1] >= other_max:
   adjust_diff = int(percent[-1] - other_max)
@@ -1,9 +1,89 @@
 import sys
 import json
+import math
 import numpy as np
-from scipy.stats import skewnorm, poisson
-from PySide6.QtCore import Signal, QAbstractTableModel
-from PySide6.QtWidgets import QApplication, QCheckBox, QWidget, QVBoxLayout, QPushButton, QLabel, QTextEdit, QDoubleSpinBox, QTableWidget, QTableWidgetItem, QHBoxLayout, QHeaderView, QFileDialog
+from demographics import (generate_settlements, format_shares, load_population_data, validate_population_data,
+                          stream_block_size)
+from PySide6.QtCore import Qt, Signal, QAbstractTableModel, QModelIndex, QObject, QRunnable, QSortFilterProxyModel, QThreadPool
+from PySide6.QtWidgets import QApplication, QCheckBox, QWidget, QVBoxLayout, QPushButton, QLabel, QTextEdit, QDoubleSpinBox, QSpinBox, QProgressBar, QLineEdit, QTableView, QHBoxLayout, QHeaderView, QFileDialog
+
+# settlements generated between progress updates and cancel checks
+generate_chunk_size = 8*stream_block_size
+# settlements written out in the result box, the rest only counted
+display_limit = 1000
+
+def format_population(tier_counts, shares, ndecimals=0):
+  output_text = 'Generated population: '
+  nrange = len(tier_counts)
+  for j, (rarity, val) in enumerate(tier_counts.items()):
+    if j < nrange-1:
+      output_text += f'{val} {rarity}, '
+    else:
+      output_text += f'and {val} {rarity}\n'
+  return output_text + '\n'.join(format_shares(shares, ndecimals))
+
+class GenerateSignals(QObject):
+  progress = Signal(int)
+  finished = Signal(str)
+  error = Signal(str)
+  cancelled = Signal()
+
+class GenerateWorker(QRunnable):
+  """
+  Generates num_settlements settlements on the thread pool in chunks, posting
+  progress in percent after each chunk and the result text when done.
+  """
+
+  def __init__(self, data, num_settlements, chances, vastmajority, ndecimals, seed):
+    super().__init__()
+    self.signals = GenerateSignals()
+    self.data = data
+    self.num_settlements = num_settlements
+    self.chances = chances
+    self.vastmajority = vastmajority
+    self.ndecimals = ndecimals
+    self.seed = seed
+    self.is_cancelled = False
+
+  def cancel(self):
+    self.is_cancelled = True
+
+  def run(self):
+    try:
+      texts = []
+      for start in range(0, self.num_settlements, generate_chunk_size):
+        if self.is_cancelled:
+          self.signals.cancelled.emit()
+          return
+        stop = min(start + generate_chunk_size, self.num_settlements)
+        batch = generate_settlements(self.data, start, stop, self.seed, self.chances, self.vastmajority, self.ndecimals)
+        if start < display_limit:
+          texts += self.format_batch(batch, start, min(stop, display_limit))
+        self.signals.progress.emit(100*stop // self.num_settlements)
+    except ValueError as e:
+      self.signals.error.emit(str(e))
+      return
+    except Exception as e:
+      # anything else would end the worker without a signal and leave Generate disabled
+      self.signals.error.emit(f'Generation failed: {type(e).__name__}: {e}')
+      return
+
+    if self.num_settlements > display_limit:
+      texts.append(f'... and {self.num_settlements - display_limit} more settlements')
+    self.signals.finished.emit('\n\n'.join(texts))
+
+  def format_batch(self, batch, start, stop):
+    records = batch.records
+    percent = records['percent'].tolist()
+    names = batch.names[records['ancestry']].tolist()
+    bounds = np.searchsorted(records['settlement'], np.arange(start, stop+1)).tolist()
+    texts = []
+    for i in range(stop - start):
+      tier_counts = dict(zip(batch.tiers, batch.tier_counts[i].tolist()))
+      shares = list(zip(percent[bounds[i]:bounds[i+1]], names[bounds[i]:bounds[i+1]]))
+      text = format_population(tier_counts, shares, self.ndecimals)
+      texts.append(text if self.num_settlements == 1 else f'Settlement {start+i+1}\n' + text)
+    return texts
 
 class AncestryChanceWidget(QWidget):
   value_changed = Signal(float)
@@ -33,23 +113,132 @@ class AncestryChanceWidget(QWidget):
   def setValue(self, value):
     self.spin.setValue(value)
 
+def parse_odds(value):
+  """
+  Odds typed into a table as a number, whole odds as an int, ValueError unless finite and >= 0.
+  """
+  odd = float(value)
+  if not math.isfinite(odd) or odd < 0:
+    raise ValueError(f'Odds must be finite and >= 0, got {value!r}')
+  return int(odd) if odd.is_integer() else odd
+
+class AncestryTableModel(QAbstractTableModel):
+  """
+  Ancestry names and odds kept in two lists, the view only asks for the
+  cells it draws so big tables load as fast as the lists can be filled.
+  """
+
+  def __init__(self, header_labels, rows=None, parent=None):
+    super().__init__(parent)
+    self.header_labels = header_labels
+    self.names = []
+    self.odds = []
+    self.set_rows(rows or [])
+
+  def rowCount(self, parent=QModelIndex()):
+    return 0 if parent.isValid() else len(self.names)
+
+  def columnCount(self, parent=QModelIndex()):
+    return 0 if parent.isValid() else 2
+
+  def data(self, index, role=Qt.DisplayRole):
+    if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+      return None
+    return self.names[index.row()] if index.column() == 0 else self.odds[index.row()]
+
+  def setData(self, index, value, role=Qt.EditRole):
+    if not index.isValid() or role != Qt.EditRole:
+      return False
+    if index.column() == 0:
+      self.names[index.row()] = str(value).strip()
+    else:
+      try:
+        self.odds[index.row()] = parse_odds(value)
+      except (TypeError, ValueError):
+        # leave the old odds in place rather than guessing
+        return False
+    self.dataChanged.emit(index, index, [role])
+    return True
+
+  def flags(self, index):
+    if not index.isValid():
+      return Qt.NoItemFlags
+    return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+  def headerData(self, section, orientation, role=Qt.DisplayRole):
+    if role != Qt.DisplayRole:
+      return None
+    if orientation == Qt.Horizontal:
+      return self.header_labels[section]
+    return section + 1
+
+  def set_rows(self, rows):
+    # rows of (ancestry, odds), parsed before the reset so bad odds leave the table as it was
+    names = [str(name) for name, _ in rows]
+    odds = [parse_odds(odd) for _, odd in rows]
+    self.beginResetModel()
+    self.names, self.odds = names, odds
+    self.endResetModel()
+
+  def append_row(self, name='', odd=1):
+    row = len(self.names)
+    self.beginInsertRows(QModelIndex(), row, row)
+    self.names.append(name)
+    self.odds.append(odd)
+    self.endInsertRows()
+    return row
+
+  def remove_rows(self, rows):
+    # highest first so the rows still to remove keep their place
+    for row in sorted(set(rows), reverse=True):
+      self.beginRemoveRows(QModelIndex(), row, row)
+      del self.names[row]
+      del self.odds[row]
+      self.endRemoveRows()
+
+  def rows(self):
+    return [list(row) for row in zip(self.names, self.odds)]
+
+  def table_data(self):
+    """
+    Ancestry -> odds of every named row, rows without a name are still being filled in.
+    """
+    return {name: odd for name, odd in zip(self.names, self.odds) if name}
+
 class AncestryTableWidget(QWidget):
   data_changed = Signal(list)
 
   def __init__(self, header_labels, data=None, parent=None):
     super().__init__(parent)
     self.header_labels = header_labels
-    self._data = data or []
+    self.model = AncestryTableModel(header_labels, data, self)
 
     self.init_ui()
-    self.populate_table()
-    self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+    header = self.table.horizontalHeader()
+    header.setSectionResizeMode(0, QHeaderView.Stretch)
+    header.setSectionResizeMode(1, QHeaderView.ResizeToContents)
 
   def init_ui(self):
     self.layout = QVBoxLayout(self)
 
-    self.table = QTableWidget(0, len(self.header_labels))
-    self.table.setHorizontalHeaderLabels(self.header_labels)
+    self.filter = QLineEdit()
+    self.filter.setPlaceholderText("Filter ancestries")
+    self.filter.setClearButtonEnabled(True)
+
+    # sorting and filtering happen in the proxy, the model keeps the file's order
+    self.proxy = QSortFilterProxyModel(self)
+    self.proxy.setSourceModel(self.model)
+    self.proxy.setFilterKeyColumn(0)
+    self.proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+    self.filter.textChanged.connect(self.proxy.setFilterFixedString)
+
+    self.table = QTableView()
+    self.table.setModel(self.proxy)
+    # no sort column until a header is clicked
+    self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+    self.table.setSortingEnabled(True)
+    self.table.setSelectionBehavior(QTableView.SelectRows)
+    self.table.verticalHeader().setVisible(False)
 
     self.button_layout = QHBoxLayout()
     self.add_button = QPushButton("Add Ancestry")
@@ -61,39 +250,29 @@ class AncestryTableWidget(QWidget):
     self.add_button.clicked.connect(self.add_row)
     self.remove_button.clicked.connect(self.remove_row)
 
+    self.layout.addWidget(self.filter)
     self.layout.addWidget(self.table)
     self.layout.addLayout(self.button_layout)
 
     self.setLayout(self.layout)
 
-  def populate_table(self):
-    self.table.setRowCount(len(self._data))
-    for row_index, row_data in enumerate(self._data):
-      for col_index, value in enumerate(row_data):
-        item = QTableWidgetItem(str(value))
-        self.table.setItem(row_index, col_index, item)
-
   def add_row(self):
-    row_count = self.table.rowCount()
-    self.table.insertRow(row_count)
-    self._data.append(["", 1])
-    #self.populate_table()
-    for col in range(len(self.header_labels)):
-      item = QTableWidgetItem(str(self._data[-1][col]))
-      self.table.setItem(row_count, col, item)
+    # clear the filter so the new, still unnamed row shows up to be edited
+    self.filter.clear()
+    row = self.model.append_row()
+    index = self.proxy.mapFromSource(self.model.index(row, 0))
+    self.table.scrollTo(index)
+    self.table.edit(index)
 
   def remove_row(self):
-    selected_rows = self.table.selectedItems()
-    if selected_rows:
-      row_to_remove = selected_rows[0].row()
-      self.table.removeRow(row_to_remove)
-      del self._data[row_to_remove]
-      self.data_changed.emit(self._data)
+    rows = [self.proxy.mapToSource(index).row() for index in self.table.selectionModel().selectedRows()]
+    if rows:
+      self.model.remove_rows(rows)
+      self.data_changed.emit(self.model.rows())
 
   def set_data(self, new_data):
-    self._data = new_data
-    self.populate_table()
-    self.data_changed.emit(self._data)
+    self.model.set_rows(new_data)
+    self.data_changed.emit(self.model.rows())
 
 class PopulationDemographicsApp(QWidget):
     def __init__(self):
@@ -102,6 +281,7 @@ class PopulationDemographicsApp(QWidget):
 
     def initUI(self):
         self.default_data()
+        self.rng = np.random.default_rng()
         layout = QVBoxLayout()
 
         top_layout = QHBoxLayout()
@@ -134,29 +314,49 @@ class PopulationDemographicsApp(QWidget):
         # create the chance widgets
         chance_layout = QHBoxLayout()
         chance_values = [0.75,0.25,0.05]
+        self.chanceWidgets = {}
         for index, table_name in enumerate(self.data.keys()):
           model = AncestryChanceWidget(table_name, chance_values[index])
           model.setObjectName(table_name+'Chance')
           chance_layout.addWidget(model)
+          self.chanceWidgets[table_name] = model
 
         # add chances to the main layout
         layout.addLayout(chance_layout)
 
         # Tables for editing ancestries and odds
         layoutAncTables = QHBoxLayout()
+        self.tables = {}
         for table_name, table_rows in self.data.items():
           headers = [table_name + ' Ancestry & Heritages', 'Odds']
           model = AncestryTableWidget(headers, list(self.data[table_name].items()))
           model.setObjectName(table_name+'Table')
           layoutAncTables.addWidget(model)
+          self.tables[table_name] = model
 
         # add ancestry tables to the main layout
         layout.addLayout(layoutAncTables)
 
-        # Generate Button
+        # Generate Button, number of settlements and progress of the running batch
+        generate_layout = QHBoxLayout()
         self.generateButton = QPushButton("Generate Population")
         self.generateButton.clicked.connect(self.generate_population)
-        layout.addWidget(self.generateButton)
+        generate_layout.addWidget(self.generateButton)
+        generate_layout.addWidget(QLabel('Settlements'))
+        self.numSettlements = QSpinBox()
+        self.numSettlements.setRange(1, 10000000)
+        self.numSettlements.setValue(1)
+        generate_layout.addWidget(self.numSettlements)
+        self.progressBar = QProgressBar()
+        self.progressBar.setRange(0, 100)
+        self.progressBar.setVisible(False)
+        generate_layout.addWidget(self.progressBar)
+        self.cancelButton = QPushButton("Cancel")
+        self.cancelButton.clicked.connect(self.cancel_generation)
+        self.cancelButton.setVisible(False)
+        generate_layout.addWidget(self.cancelButton)
+        layout.addLayout(generate_layout)
+        self.worker = None
 
         self.resultText = QTextEdit()
         self.resultText.setReadOnly(True)
@@ -173,59 +373,31 @@ class PopulationDemographicsApp(QWidget):
       tables = self.get_all_tables()
       for table_name, table_data in new_data.items():
         if table_name in tables:
-          table_rows = [[k, str(v)] for k, v in table_data.items()]
+          table_rows = [[k, v] for k, v in table_data.items()]
           tables[table_name].set_data(table_rows)
 
     def sync_data_from_tables(self):
       tables = self.get_all_tables()
-      for table_name in tables.keys():
-        self.data[table_name] = self.get_table_data(tables[table_name])
+      data = {table_name: self.get_table_data(table) for table_name, table in tables.items()}
+      self.data.update(validate_population_data(data, 'Ancestry tables'))
 
     def get_all_chances(self):
-      chances = {}
-      for table_name in self.data.keys():
-        chance = self.findChild(AncestryChanceWidget, f'{table_name}Chance').value()
-        chances[table_name] = chance
-      return chances
+      return {table_name: self.chanceWidgets[table_name].value() for table_name in self.data.keys()}
 
     def get_all_tables(self):
-      tables = {}
-      for table_name in self.data.keys():
-        table = self.findChild(AncestryTableWidget, table_name+'Table')
-        if table:
-          tables[table_name] = table
-      return tables
+      return {table_name: self.tables[table_name] for table_name in self.data.keys() if table_name in self.tables}
 
     def get_table_data(self, table):
-      ancestries = []
-      odds = []
-      for row in range(table.table.rowCount()):
-        name_item = table.table.item(row,0)
-        ancestry = name_item.text() if name_item else ""
-        odds_item = table.table.item(row,1)
-        try:
-          odd = int(float(odds_item.text())) if odds_item and odds_item and odds_item.text() else 1
-        except ValueError:
-          odd = 1
-
-        ancestries.append(ancestry)
-        odds.append(odd)
-
-      return dict(zip(ancestries, odds))
+      return table.model.table_data()
 
     def generate_population(self):
-      self.sync_data_from_tables()
-
-      # pull over script
-      #vastmajority = False
+      try:
+        self.sync_data_from_tables()
+      except ValueError as e:
+        self.resultText.setText(str(e))
+        return
 
       ndecimals = int(self.ndecimals.value())
-      if ndecimals > 0:
-        scale = 10**(ndecimals)
-        width = 3+ndecimals
-      else:
-        scale = 1
-        width = 2
 
       chances = self.get_all_chances()
       chance_sum = 0
@@ -236,118 +408,49 @@ class PopulationDemographicsApp(QWidget):
           self.resultText.setText('No chance can be 1')
           return
 
-      nmax = {}
-      for rarity, ancestries in self.data.items():
-        nmax[rarity] = np.count_nonzero(list(ancestries.values()))
-
-      maxiterations = 0
-      n = {}
-      #nrarity = np.size(list(self.data.keys()))
-      if(chance_sum > 0):
-        while(maxiterations<1):
-          for j, (rarity, chance) in enumerate(chances.items()):
-            #n[rarity] = min(nmax[rarity], np.random.geometric(1-chance)-1)
-            n[rarity] = min(nmax[rarity], poisson.rvs(0.25+2**chance))
-
-          maxiterations = np.sum(list(n.values()))
-
-      else:
+      if(chance_sum <= 0):
         self.resultText.setText('At least one chance must be non-zero.')
         return
 
-      # convert x_chance to a y_scale for skewnorm
-      # y_scale = -27.2343 * tan( 1.4076 * (x_chance - 0.5) )
-      # loc = x_chance
-      choice = np.array([])
-      dist = np.array([])
-      for rarity, chance in chances.items():
-        skew_scale = np.around(27.2343*np.tan(-1.4076*(chance - 0.5)))
-        sum_odds = np.sum(list(self.data[rarity].values()))
-        choice = np.append(choice, np.random.choice(list(self.data[rarity].keys()), n[rarity], replace=False, p=list(self.data[rarity].values())/sum_odds))
-        dist = np.append(dist, skewnorm.rvs(skew_scale, loc=chance, scale=0.20, size=n[rarity]))
-
-      sort_idx = np.argsort(dist)[::-1]
-      dist = dist[sort_idx]
-      choice = choice[sort_idx]
-
-      if(maxiterations>1):
-        tol = 2 * scale # tolerance, when remainder is less than end simulation
-        remainder = 100 * scale
-
-        if(self.vastMajority.isChecked()):
-          mode = 75
-          rng = int(scale * np.random.triangular(61, mode, 90))
-          rng = int(scale * np.random.randint(60,91))
-        else:
-          mode = 35
-          rng = int(scale * np.random.triangular(11, mode, 60))
-          rng = int(scale * np.random.randint(10, 61))
-        # population demographic
-        popdemo = np.array([rng], dtype='int')
-        remainder -= rng
-
-        iterations = 1
-        while(remainder >= tol and iterations < maxiterations):
-          rng = int(np.random.triangular(1 * scale,remainder//2,remainder))
-          rng = int(np.random.randint(1 * scale,remainder+1))
-
-          popdemo = np.append(popdemo, rng)
-          remainder -= rng
-          iterations += 1
-
-        popdemo = np.sort(popdemo)[::-1]
-        nsum = sum(list(nmax.values()))
-        other_cap = min(nsum//3, np.random.randint(7,15))
-        other_cap *= scale
-        other_diff = remainder - other_cap
-
-        if(other_diff < 0):
-          if(iterations < maxiterations):
-            diff = maxiterations-iterations
-            for i in range(diff):
-              idx = np.argmax(popdemo)
-              shift = np.random.randint(1,scale*(diff-i)+1)
-              popdemo[idx] -= shift
-              popdemo = np.append(popdemo, shift)
-            popdemo = np.sort(popdemo)[::-1]
-            popdemo = np.append(popdemo,remainder)
-          else:
-            popdemo = np.sort(popdemo)[::-1]
-            popdemo = np.append(popdemo,remainder)
-        else:
-          popdiff1 = np.random.randint(0,other_diff+1)
-          popdiff2 = other_diff - popdiff1
-          popdemo[0] += max(popdiff1,popdiff2)
-          popdemo[1] += min(popdiff1,popdiff2)
-          popdemo = np.append(popdemo, other_cap)
-
-        if ndecimals > 0:
-          popdemo = np.round(popdemo / scale, ndecimals)
-
-
-        output_text = 'Generated population: '
-        nrange = np.size(list(n.values()))
-        for j, (rarity, val) in enumerate(n.items()):
-          if j < nrange-1:
-            output_text += f'{val} {rarity}, '
-          else:
-            output_text += f'and {val} {rarity}\n'
-        choice = np.append(choice,'other')
-        for val, anc in zip(popdemo, choice):
-          output_text += f'{val:{width}}' + '%: ' + anc + '\n'
-
-      else:
-        output_text = 'Generated population: '
-        nrange = np.size(list(n.values()))
-        for j, (rarity, val) in enumerate(n.items()):
-          if j < nrange-1:
-            output_text += f'{val} {rarity}, '
-          else:
-            output_text += f'and {val} {rarity}\n'
-        output_text += f'99%: {choice[0]}\n'
-        output_text += ' 1%: other'
-
-      self.resultText.setText(output_text)
+      # the worker gets its own copy of the data and a seed drawn here, so
+      # edits made while it runs don't reach it and self.rng stays on this thread
+      data = {table_name: dict(table_data) for table_name, table_data in self.data.items()}
+      seed = np.random.SeedSequence(self.rng.integers(2**63))
+      self.worker = GenerateWorker(data, self.numSettlements.value(), chances, self.vastMajority.isChecked(),
+                                   ndecimals, seed)
+      self.worker.signals.progress.connect(self.progressBar.setValue)
+      self.worker.signals.finished.connect(self.generation_finished)
+      self.worker.signals.error.connect(self.generation_finished)
+      self.worker.signals.cancelled.connect(self.generation_cancelled)
+
+      self.generateButton.setEnabled(False)
+      self.progressBar.setValue(0)
+      self.progressBar.setVisible(True)
+      self.cancelButton.setVisible(True)
+      QThreadPool.globalInstance().start(self.worker)
+
+    def cancel_generation(self):
+      if self.worker:
+        self.worker.cancel()
+
+    def generation_done(self):
+      self.worker = None
+      self.generateButton.setEnabled(True)
+      self.progressBar.setVisible(False)
+      self.cancelButton.setVisible(False)
+
+    def generation_finished(self, text):
+      self.generation_done()
+      self.resultText.setText(text)
+
+    def generation_cancelled(self):
+      self.generation_done()
+      self.resultText.setText('Generation cancelled.')
+
+    def closeEvent(self, event):
+      self.cancel_generation()
+      QThreadPool.globalInstance().waitForDone()
+      super().closeEvent(event)
 
     def default_data(self):
       self.data = {
@@ -427,8 +530,7 @@ class PopulationDemographicsApp(QWidget):
         return
 
       try:
-        with open(filepath, 'r') as f:
-          data = json.load(f)
+        data = load_population_data(filepath)
 
         self.refresh_tables_from_data(data)
         self.resultText.setText("Population data loaded successfully!")
@@ -437,8 +539,11 @@ class PopulationDemographicsApp(QWidget):
         self.resultText.setText(f"Error loading file: {str(e)}")
 
     def save_to_file(self):
-      # might need sync_data_from_tables() instead
-      self.sync_data_from_tables()
+      try:
+        self.sync_data_from_tables()
+      except ValueError as e:
+        self.resultText.setText(f"Error saving file: {str(e)}")
+        return
       filepath, _ = QFileDialog.getSaveFileName(self)
 
       if not filepath:
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+import io
+import os
+import csv
+import sys
+import json
+
+import numpy as np
+
+
+# streaming output for generated settlements, one row per (settlement, ancestry)
+# in the schema below, written chunk by chunk so memory stays flat however many
+# settlements there are. the format comes from the file extension:
+#   .csv, or - for csv on stdout
+#   .ndjson / .jsonl    one json object per line
+#   .arrow / .feather   Arrow IPC file, pyarrow.memory_map + pyarrow.ipc.open_file
+#                       read it back without copying
+#   .parquet            one row group per chunk
+#
+# chunks are encoded by encode_chunk, so process pools can encode in the workers
+# and leave the parent only the writing. csv and ndjson are encoded with the
+# standard library, only arrow and parquet need pyarrow, imported when used
+
+columns = ['settlement', 'type', 'population', 'level', 'ancestry', 'percent']
+
+writer_formats = {
+  '.csv': 'csv',
+  '.ndjson': 'ndjson',
+  '.jsonl': 'ndjson',
+  '.arrow': 'arrow',
+  '.feather': 'arrow',
+  '.parquet': 'parquet',
+}
+
+def output_format(path):
+  if path == '-':
+    return 'csv'
+  fmt = writer_formats.get(os.path.splitext(path)[1].lower())
+  if fmt is None:
+    raise ValueError(f'Unknown output format for {path}, use one of {", ".join(writer_formats)}')
+  return fmt
+
+def settlement_schema(ndecimals=0):
+  """
+  Arrow schema of the output, percent is an integer unless ndecimals > 0.
+  """
+  import pyarrow as pa
+  return pa.schema([('settlement', pa.int64()), ('type', pa.string()), ('population', pa.int64()),
+                    ('level', pa.int64()), ('ancestry', pa.string()),
+                    ('percent', pa.float64() if ndecimals > 0 else pa.int64())])
+
+def encode_chunk(chunk, fmt, ndecimals=0):
+  """
+  Encode a dict of column arrays for SettlementWriter.write: text for csv and
+  ndjson, a pyarrow RecordBatch for arrow and parquet.
+  """
+  percent = np.asarray(chunk['percent'], dtype='float' if ndecimals > 0 else 'int64')
+  if fmt in ('arrow', 'parquet'):
+    import pyarrow as pa
+    arrays = [pa.array(np.asarray(chunk[column])) for column in columns[:-1]] + [pa.array(percent)]
+    return pa.RecordBatch.from_arrays(arrays, schema=settlement_schema(ndecimals))
+
+  values = [np.asarray(chunk[column]).tolist() for column in columns[:-1]]
+  if fmt == 'ndjson':
+    # a chunk only has a handful of distinct types and ancestries, quote each once
+    quoted = {}
+    def quote(text):
+      if text not in quoted:
+        quoted[text] = json.dumps(text)
+      return quoted[text]
+    # rounded so the shortest repr of the float is the percent as rounded
+    percent = np.round(percent, ndecimals).tolist()
+    return ''.join(f'{{"settlement":{i},"type":{quote(kind)},"population":{population},"level":{level},'
+                   f'"ancestry":{quote(ancestry)},"percent":{share}}}\n'
+                   for i, kind, population, level, ancestry, share in zip(*values, percent))
+
+  percent = [f'{share:.{ndecimals}f}' for share in percent.tolist()] if ndecimals > 0 else percent.tolist()
+  text = io.StringIO()
+  csv.writer(text, lineterminator='\n').writerows(zip(*values, percent))
+  return text.getvalue()
+
+class SettlementWriter:
+  """
+  Streams encoded settlement chunks into a single file of any writer_formats.
+  """
+
+  def __init__(self, path, ndecimals=0):
+    self.path = path
+    self.format = output_format(path)
+    self.ndecimals = ndecimals
+
+    if self.format in ('arrow', 'parquet'):
+      import pyarrow as pa
+      import pyarrow.parquet as pq
+      schema = settlement_schema(ndecimals)
+      if self.format == 'arrow':
+        self.writer = pa.ipc.new_file(path, schema)
+      else:
+        self.writer = pq.ParquetWriter(path, schema)
+    else:
+      self.file = sys.stdout if path == '-' else open(path, 'w')
+      if self.format == 'csv':
+        self.file.write(','.join(columns) + '\n')
+
+  def write(self, block):
+    if self.format in ('arrow', 'parquet'):
+      self.writer.write_batch(block)
+    else:
+      self.file.write(block)
+
+  def close(self):
+    if self.format in ('arrow', 'parquet'):
+      self.writer.close()
+    elif self.file is not sys.stdout:
+      self.file.close()
@@ -4,10 +4,20 @@ import numpy as np
 from scipy.stats import poisson
 from matplotlib import pyplot as plt
 
+from demographics import generate_demographics_batch
+
+seed = None
+rng = np.random.default_rng(seed)
+
+# a small data file with decimals often runs out of remainder before every
+# ancestry gets a share, those settlements must not list unfilled shares
+batch = generate_demographics_batch({'Common': {'a': 1, 'b': 1, 'c': 1}}, 200000, ndecimals=1, rng=rng)
+assert (batch.records['percent'] >= 0).all(), 'negative percentages with 3 ancestries and 1 decimal'
+
 chances = np.array([0.05,0.25,0.70])
 plt.figure()
 for j, chance in enumerate(chances):
-  prob = poisson.rvs(0.5+ 1*(chance), size=1000)
+  prob = poisson.rvs(0.5+ 1*(chance), size=1000, random_state=rng)
   end = np.max(prob)+1
   t = np.arange(0,end)-0.5
   plt.hist(prob, bins=t, histtype='step', align='mid', density=True)
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from demographics import (default_chances, load_population_data, compile_population_data, generate_settlements,
+                          block_seed, stream_block_size)
+from settlement_writer import SettlementWriter, encode_chunk, writer_formats
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'table-generators'))
+from settlement_tables import nd, settlement_types, settlement_table
+
+
+# generate a whole campaign world: for every settlement roll its type, a d20 on
+# that type's population table for its population and level, and an ancestry
+# breakdown, e.g.
+#   ./world_generator.py -n 1000000 --seed 7 -o world.parquet
+#
+# settlements are split into shards of whole stream blocks that a process pool
+# generates and encodes, the parent only writes finished shards to disk in
+# order, with a bounded number in flight, so memory stays flat however big the
+# world is. the output is one row per (settlement, ancestry) from the biggest
+# share down to 'other' in any settlement_writer format, and the same seed gives
+# the same rows for any number of workers or shard size.
+
+# relative odds of each settlement type
+default_type_weights = {'Hamlet': 40, 'Village': 30, 'Town': 18, 'City': 10, 'Metropolis': 2}
+
+# stream blocks per shard
+default_shard_blocks = 16
+
+def settlement_tables(types=settlement_types, num_divisions=nd):
+  """
+  settlement_table of every type stacked into arrays of shape (len(types), num_divisions).
+  """
+  tables = [settlement_table(settlement_type, num_divisions) for settlement_type in types]
+  min_pop, max_pop, level = (np.array(column) for column in zip(*tables))
+  # the smallest hamlet rows round to an empty range, they roll their minimum
+  return min_pop, np.maximum(max_pop, min_pop), level
+
+def roll_settlements(tables, type_weights, start, stop, seed):
+  """
+  Type, d20 roll, population and level of settlements start..stop-1.
+
+  Drawn per stream block like generate_settlements, from its own child of seed.
+  Returns arrays (type index, roll index, population, level).
+  """
+  min_pop, max_pop, level = tables
+  cumulative = np.cumsum(type_weights)
+  out = []
+  for block in range(start // stream_block_size, -(-stop // stream_block_size)):
+    first = block * stream_block_size
+    lo, hi = max(start, first) - first, min(stop, first + stream_block_size) - first
+    rng = np.random.default_rng(block_seed(seed, block))
+    kind = np.searchsorted(cumulative, cumulative[-1]*rng.random(stream_block_size), side='right')
+    roll = rng.integers(0, min_pop.shape[1], stream_block_size)
+    population = rng.integers(min_pop[kind, roll], max_pop[kind, roll]+1)
+    out.append((kind[lo:hi], roll[lo:hi], population[lo:hi], level[kind, roll][lo:hi]))
+  return tuple(np.concatenate(column) for column in zip(*out))
+
+# filled in by init_worker in each worker process
+worker_settings = None
+
+def init_worker(settings):
+  global worker_settings
+  worker_settings = settings
+  # compile the population data once per worker, later shards reuse it
+  compile_population_data(settings['data'], settings['chances'].keys())
+
+def run_shard(shard):
+  """
+  Generate settlements start..stop-1 and encode them for the SettlementWriter.
+  """
+  start, stop = shard
+  s = worker_settings
+  kind, roll, population, level = roll_settlements(s['tables'], s['type_weights'], start, stop, s['settlement_seed'])
+  batch = generate_settlements(s['data'], start, stop, s['demographics_seed'], s['chances'], s['vastmajority'], s['ndecimals'])
+
+  records = batch.records
+  row = records['settlement'] - start
+  chunk = {'settlement': records['settlement'],
+           'type': np.asarray(s['types'])[kind[row]],
+           'population': population[row],
+           'level': level[row],
+           'ancestry': batch.names[records['ancestry']],
+           'percent': records['percent']}
+  return stop - start, encode_chunk(chunk, s['format'], s['ndecimals'])
+
+def shards(num_settlements, shard_size):
+  for start in range(0, num_settlements, shard_size):
+    yield start, min(start + shard_size, num_settlements)
+
+def generate_world(data, num_settlements, output, seed=None, chances=None, type_weights=None, vastmajority=False,
+                   ndecimals=0, workers=None, shard_blocks=default_shard_blocks):
+  """
+  Generate num_settlements settlements over a process pool and stream them to output.
+
+  Parameters:
+  - data: population data dict of tier -> {ancestry: odds}
+  - output: path with one of the settlement_writer.writer_formats extensions, or - for csv on stdout
+  - seed: int or SeedSequence of the world, None for fresh entropy
+  - chances, vastmajority, ndecimals: as in generate_demographics_batch
+  - type_weights: dict of settlement type -> relative odds, defaults to default_type_weights
+  - workers: number of processes, defaults to os.cpu_count()
+  - shard_blocks: stream blocks per shard
+
+  Returns the SeedSequence of the world, its entropy reproduces the file.
+  """
+  seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+  chances = chances if chances is not None else default_chances
+  type_weights = type_weights if type_weights is not None else default_type_weights
+  unknown = set(type_weights) - set(settlement_types)
+  if unknown:
+    raise ValueError(f'Unknown settlement types {sorted(unknown)}, expected some of {settlement_types}')
+  types = list(type_weights.keys())
+  compile_population_data(data, chances.keys())
+
+  writer = SettlementWriter(output, ndecimals)
+  settings = {
+    'format': writer.format,
+    'data': data,
+    'chances': chances,
+    'vastmajority': vastmajority,
+    'ndecimals': ndecimals,
+    'types': types,
+    'type_weights': np.array([type_weights[t] for t in types], dtype='float'),
+    'tables': settlement_tables(types),
+    # separate children so the ancestry breakdowns don't depend on the settlement rolls
+    'demographics_seed': block_seed(seed, 0),
+    'settlement_seed': block_seed(seed, 1),
+  }
+  workers = workers or os.cpu_count()
+
+  try:
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(settings,)) as executor:
+      # shards finish out of order but are written in order, a couple per worker in flight
+      pending = deque()
+      for shard in shards(num_settlements, shard_blocks*stream_block_size):
+        pending.append(executor.submit(run_shard, shard))
+        if len(pending) >= 2*workers:
+          writer.write(pending.popleft().result()[1])
+      while pending:
+        writer.write(pending.popleft().result()[1])
+  finally:
+    writer.close()
+
+  return seed
+
+def parse_type_weights(text):
+  """
+  'Hamlet=40,Village=30,...' into a dict of settlement type -> weight.
+  """
+  weights = {}
+  for item in text.split(','):
+    name, sep, value = item.partition('=')
+    if not sep:
+      raise argparse.ArgumentTypeError(f'Expected type=weight, got {item!r}')
+    weights[name.strip()] = float(value)
+  return weights
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Generate settlement types, populations, levels and ancestries for a whole world.')
+  parser.add_argument('-n', '--settlements', type=int, default=1000, help='number of settlements (default: 1000)')
+  parser.add_argument('-d', '--data', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'population-data-dnd5e.json'),
+                      help='population data json (default: population-data-dnd5e.json)')
+  parser.add_argument('-o', '--output', default='-',
+                      help=f'output path ending in {", ".join(writer_formats)}, or - for csv on stdout (default)')
+  parser.add_argument('--seed', type=int, help='world seed, printed when left out so the world can be regenerated')
+  parser.add_argument('--types', type=parse_type_weights, help='settlement type weights, e.g. Hamlet=40,Village=30,Town=18,City=10,Metropolis=2')
+  parser.add_argument('--vast-majority', action='store_true', help='the biggest ancestry takes 61-90%%')
+  parser.add_argument('--decimals', type=int, default=0, help='decimal places of the percentages (default: 0)')
+  parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+  parser.add_argument('--shard-blocks', type=int, default=default_shard_blocks,
+                      help=f'blocks of {stream_block_size} settlements per shard (default: {default_shard_blocks})')
+  args = parser.parse_args(argv)
+
+  try:
+    data = load_population_data(args.data)
+    seed = generate_world(data, args.settlements, args.output, args.seed, type_weights=args.types,
+                          vastmajority=args.vast_majority, ndecimals=args.decimals, workers=args.workers,
+                          shard_blocks=args.shard_blocks)
+  except (OSError, ValueError) as e:
+    print(f'Error: {e}', file=sys.stderr)
+    return 2
+
+  print(f'{args.settlements} settlements written, seed {seed.entropy}', file=sys.stderr)
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+import math
+
+import numpy as np
+
+
+# settlement population and level tables, shared by
+# settlement-population-level-table-generator.py and the world generator in
+# population-demographics, one row per roll of an nd sided die
+
+# define size of die to make table from
+nd = 20
+# define settlement types and their population ranges
+settlement_types = ['Hamlet', 'Village', 'Town', 'City', 'Metropolis']
+pop_ranges = [(2,25e0), (25e0,25e1), (25e1,25e2), (25e2,25e3), (25e3,25e4)]
+level_ranges = [(0,0), (0,1), (2,4), (5,7), (8,20)]
+
+# function to create logarithmic divisions for a d20 roll
+def create_log_divisions(min_val, max_val, num_divisions=nd):
+  # use log scale for population
+  log_min = math.log(min_val)
+  log_max = math.log(max_val)
+
+  # create divisions in log space
+  log_divisions = np.linspace(log_min, log_max, num_divisions + 1)
+
+  # convert back to original scale and round to integers
+  divisions = np.round(np.exp(log_divisions)).astype(int)
+
+  # ensure the min and max values are exactly as specified
+  divisions[0] = min_val
+  divisions[-1] = max_val
+
+  return divisions
+
+def create_log_level_divisions(min_level, max_level, num_divisions=nd):
+  if min_level == max_level:
+    return [min_level] * (num_divisions+1)
+
+  log_divisions = np.linspace(math.log(min_level+1), math.log(max_level+1), num_divisions)
+  divisions = np.round(np.exp(log_divisions)).astype(int)-1
+
+  divisions[0] = min_level
+  divisions[-1] = max_level
+
+  return divisions
+
+def settlement_table(settlement_type, num_divisions=nd):
+  """
+  Population range and level of each roll for one of the settlement_types.
+
+  Returns arrays (min_pop, max_pop, level) of length num_divisions, row j is a
+  roll of j+1. Only the last row includes the top of its division.
+  """
+  i = settlement_types.index(settlement_type)
+  min_pop, max_pop = pop_ranges[i]
+  min_level, max_level = level_ranges[i]
+
+  pop_divisions = create_log_divisions(min_pop, max_pop, num_divisions)
+  level_divisions = create_log_level_divisions(min_level, max_level, num_divisions)
+
+  min_pop_range = pop_divisions[:-1]
+  max_pop_range = pop_divisions[1:]-1
+  max_pop_range[-1] = pop_divisions[-1]
+  level = np.asarray(level_divisions[:num_divisions])
+
+  return min_pop_range, max_pop_range, level